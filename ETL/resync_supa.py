@@ -211,4 +211,14 @@ def sync_and_check_references():
         excluir_itens_em_lotes(list(ids_para_excluir.keys()))
 
 
+def atualizar_candidatos_fallback():
+    print("Atualizando candidatos de fallback...")
+    try:
+        supabase.rpc("refresh_fallback_candidates", {}).execute()
+        print("Candidatos de fallback atualizados!")
+    except Exception as e:
+        print(f"Erro ao atualizar candidatos de fallback: {e}")
+
+
 sync_and_check_references()
+atualizar_candidatos_fallback()
@@ -0,0 +1,382 @@
+"""
+Per-request benchmark of the by_user and by_item recommendation services.
+
+DynamoDB and Supabase are replaced by in-memory stand-ins that sleep a fixed
+latency per remote call, so the numbers reflect how many round trips a
+request makes, how many rows come back and how much Python work sits
+between them. The
+`get_recommendations` fallback is emulated (top-rated unseen items per
+category weighted by genre), not a port of the SQL.
+
+Run from the repository root:
+    PYTHONPATH=src/layers/common_layer:src/layers/recommendation_layer/python:jobs \\
+        python benchmarks/endpoints.py
+"""
+
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import common.supabase_funcs as supabase_funcs
+import utils
+from common.configs import CATEGORIES_AVAILABLE
+from loguru import logger
+from similarity import calculate_recomendations
+from synthetic import make_catalog, make_ratings, to_library_items
+
+FUNCTIONS_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "src", "functions", "recommendations"
+)
+
+
+class CallCounter:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def call(self, rows=0):
+        with self._lock:
+            self.calls += 1
+            self.rows += rows
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class TableQuery:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self.filters = []
+        self.order_by = None
+        self.columns = None
+
+    def select(self, columns):
+        if columns != "*":
+            self.columns = [
+                c.strip().split(":")[-1] for c in columns.split(",") if c.strip()
+            ]
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, {str(value)}))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append((column, {str(v) for v in values}))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def execute(self):
+        rows = self.backend.rows_for(self.name, self.filters)
+        if self.order_by:
+            column, desc = self.order_by
+            rows = sorted(rows, key=lambda row: row[column], reverse=desc)
+        if self.columns:
+            rows = [{c: row.get(c) for c in self.columns} for row in rows]
+        self.backend.counter.call(len(rows))
+        return Response(rows)
+
+
+class RpcCall:
+    def __init__(self, backend, name, params):
+        self.backend = backend
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        rows = getattr(self.backend, self.name)(**self.params)
+        self.backend.counter.call(len(rows))
+        return Response(rows)
+
+
+class InMemorySupabase:
+    """Stand-in for the Supabase client: `midia` and `recommendations` tables and RPCs."""
+
+    def __init__(self, catalog, recommendations, latency):
+        self.counter = CallCounter(latency)
+        self.midia = {
+            str(row["id"]): {**row, "descricao": "", "imagem": "", "metadata": {}}
+            for row in catalog.to_dict("records")
+        }
+        self.by_source = {}
+        for row in recommendations.to_dict("records"):
+            row["origem_id"] = int(row["origem_id"])
+            row["alvo_id"] = int(row["alvo_id"])
+            key = (str(row["origem_id"]), row["origem_categoria"])
+            self.by_source.setdefault(key, []).append(row)
+        self.top_rated = {
+            cat: sorted(
+                (row for row in self.midia.values() if row["categoria"] == cat),
+                key=lambda row: row["rating"],
+                reverse=True,
+            )
+            for cat in CATEGORIES_AVAILABLE
+        }
+        self.fallback_candidates = self._fallback_candidates(pool_size=100)
+
+    def _fallback_candidates(self, pool_size):
+        """Rows of the fallback_candidates view, keyed by genero."""
+        view = {}
+        for cat, rows in self.top_rated.items():
+            view.setdefault("*", []).extend(
+                {**row, "genero": "*", "pos": pos}
+                for pos, row in enumerate(rows[:pool_size], 1)
+            )
+            per_genre = {}
+            for row in rows:
+                if float(row["rating"]) < 2.0:
+                    continue
+                for genre in row["generos_unificados"]:
+                    ranked = per_genre.setdefault(genre, [])
+                    if len(ranked) < pool_size:
+                        ranked.append({**row, "genero": genre, "pos": len(ranked) + 1})
+            for genre, ranked in per_genre.items():
+                view.setdefault(genre, []).extend(ranked)
+        return view
+
+    def table(self, name):
+        return TableQuery(self, name)
+
+    def rpc(self, name, params):
+        return RpcCall(self, name, params)
+
+    def rows_for(self, name, filters):
+        filters = dict(filters)
+        if name == "midia":
+            rows = [self.midia[i] for i in filters.pop("id") if i in self.midia]
+        elif name == "fallback_candidates":
+            rows = [
+                row
+                for genre in filters.pop("genero")
+                for row in self.fallback_candidates.get(genre, [])
+            ]
+        else:
+            key = (
+                filters.pop("origem_id").pop(),
+                filters.pop("origem_categoria").pop(),
+            )
+            rows = self.by_source.get(key, [])
+        return [
+            row
+            for row in rows
+            if all(str(row[column]) in values for column, values in filters.items())
+        ]
+
+    def get_batch_recommendations(self, source_ids, source_types):
+        return [
+            row
+            for key in zip(map(str, source_ids), source_types)
+            for row in self.by_source.get(key, [])
+        ]
+
+    def get_ranked_recommendations(
+        self, source_ids, source_types, seen_ids, per_category=36
+    ):
+        seen = set(seen_ids)
+        totals = {}
+        for row in self.get_batch_recommendations(source_ids, source_types):
+            if row["alvo_id"] in seen:
+                continue
+            key = (row["alvo_id"], row["alvo_categoria"])
+            score, sources = totals.get(key, (0.0, 0))
+            totals[key] = (score + row["score"], sources + 1)
+
+        def rank_key(entry):
+            (alvo_id, cat), (score, _) = entry
+            return cat, -score, alvo_id
+
+        ranked = sorted(totals.items(), key=rank_key)
+        result, taken = [], {}
+        for (alvo_id, cat), (score, sources) in ranked:
+            taken[cat] = taken.get(cat, 0) + 1
+            if taken[cat] <= per_category:
+                result.append(
+                    {
+                        "alvo_id": alvo_id,
+                        "alvo_categoria": cat,
+                        "score": score,
+                        "sources": sources,
+                    }
+                )
+        return result
+
+    def get_recommendations(self, p_consumed_ids, p_top_genres, p_limit=10):
+        consumed = set(p_consumed_ids or [])
+        weights = p_top_genres or {}
+        result = []
+        for rows in self.top_rated.values():
+            pool = [row for row in rows if row["id"] not in consumed]
+            pool.sort(
+                key=lambda row: sum(
+                    weights.get(g, 0) for g in row["generos_unificados"]
+                )
+                + float(row["rating"]),
+                reverse=True,
+            )
+            result.extend(pool[:p_limit])
+        return result
+
+
+class InMemoryDynamo:
+    """Stand-in for DynamoClient covering the calls the recommendation services make."""
+
+    def __init__(self, histories, latency):
+        self.counter = CallCounter(latency)
+        self.histories = histories
+        self.items = {}
+
+    def iter_query(
+        self, user_id, sk_prefix=None, page_size=1000, projection=None, categories=None
+    ):
+        items = [
+            item
+            for item in self.histories.get(user_id, [])
+            if not sk_prefix or item["sk"].startswith(sk_prefix)
+        ]
+        self.counter.call(len(items))
+        yield from items
+
+    def batch_get_items(self, user_id, sks, projection=None):
+        self.counter.call()
+        return {
+            sk: self.items[(user_id, sk)] for sk in sks if (user_id, sk) in self.items
+        }
+
+    def get_revision(self, user_id):
+        return (
+            self.batch_get_items(user_id, ["meta#rev"]).get("meta#rev", {}).get("rev")
+        )
+
+    def put_item(self, item):
+        self.counter.call()
+        self.items[(item["user_id"], item["sk"])] = item
+        return True
+
+    def put_item_at_revision(self, item, rev):
+        current = self.items.get((item["user_id"], "meta#rev"), {}).get("rev")
+        if current != rev:
+            self.counter.call()
+            return False
+        return self.put_item(item)
+
+
+def load_service(name):
+    path = os.path.join(FUNCTIONS_DIR, name, "service.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_service", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def install(supabase, dynamo, *modules):
+    supabase_funcs.supabase = supabase
+    for module in (utils, *modules):
+        for name, fake in (("supabase", supabase), ("db_client", dynamo)):
+            if hasattr(module, name):
+                setattr(module, name, fake)
+
+
+def bench(label, request, users, supabase, dynamo, warm_cache):
+    timings, remote_calls, rows = [], [], []
+    for user_id in users:
+        if not warm_cache:
+            supabase_funcs.midia_cache.clear()
+            supabase_funcs.fallback_cache.clear()
+        calls_before = supabase.counter.calls + dynamo.counter.calls
+        rows_before = supabase.counter.rows + dynamo.counter.rows
+        start = time.perf_counter()
+        request(user_id)
+        timings.append(time.perf_counter() - start)
+        remote_calls.append(
+            supabase.counter.calls + dynamo.counter.calls - calls_before
+        )
+        rows.append(supabase.counter.rows + dynamo.counter.rows - rows_before)
+
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{label:<10} {statistics.mean(timings) * 1000:>9.1f} "
+        f"{statistics.median(timings) * 1000:>9.1f} {p95 * 1000:>9.1f} "
+        f"{statistics.mean(remote_calls):>8.1f} {statistics.mean(rows):>9.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ratings", type=int, default=200_000)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--warm-cache", action="store_true")
+    parser.add_argument("--server-side-ranking", action="store_true")
+    parser.add_argument("--fallback-from-pool", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    catalog = make_catalog(args.items, seed=args.seed)
+    ratings = make_ratings(args.ratings, catalog, seed=args.seed)
+    histories = to_library_items(ratings)
+    latency = args.latency_ms / 1000
+    supabase = InMemorySupabase(catalog, calculate_recomendations(ratings), latency)
+    dynamo = InMemoryDynamo(histories, latency)
+
+    by_user = load_service("by_user")
+    by_item = load_service("by_item")
+    install(supabase, dynamo, by_user, by_item)
+    by_user.SERVER_SIDE_RANKING = args.server_side_ranking
+    supabase_funcs.FALLBACK_FROM_POOL = args.fallback_from_pool
+
+    # The heaviest libraries first: they are the slow requests in production.
+    users = sorted(histories, key=lambda u: len(histories[u]), reverse=True)
+    users = users[: args.requests]
+    sources = {user_id: histories[user_id][0]["sk"].split("#")[1:] for user_id in users}
+
+    print(
+        f"{len(ratings):,} ratings, {len(histories):,} users, {args.latency_ms} ms/call"
+    )
+    print(
+        f"{'endpoint':<10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'calls':>8} {'rows':>9}"
+    )
+    bench(
+        "by_user",
+        lambda user_id: by_user.process_user_recommendations(user_id),
+        users,
+        supabase,
+        dynamo,
+        args.warm_cache,
+    )
+    bench(
+        "by_item",
+        lambda user_id: by_item.process_recommendations(
+            user_id, int(sources[user_id][1]), sources[user_id][0]
+        ),
+        users,
+        supabase,
+        dynamo,
+        args.warm_cache,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmark: Pydantic row encoding vs the table-driven fast path.
+
+Run from the repository root:
+    PYTHONPATH=src/layers/common_layer python benchmarks/row_encoder.py
+"""
+
+import argparse
+import json
+import random
+import time
+
+from common.models import ListItemsItem, json_encode_item, encode_midia_row
+
+SAMPLE_METADATA = {
+    "livro": {"autor": "Machado de Assis", "paginas": 256, "editora": "Garnier"},
+    "filme": {"duracao": "2h 15m", "diretor": "Fernando Meirelles", "star": "Alice"},
+    "jogo": {
+        "plataformas": "['PC', 'PlayStation 5', 'Xbox Series X']",
+        "desenvolvedores": "FromSoftware",
+    },
+    "anime": {"episodios": 24, "id_original": 5114},
+    "manga": {
+        "type": "Manga",
+        "status": "Finished",
+        "volumes": 27,
+        "chapters": 116,
+        "authors": ["Arakawa, Hiromu"],
+        "serializations": ["Shounen Gangan"],
+        "mal_id": 25,
+    },
+    "serie": {
+        "duracao_media": 50,
+        "criadores": "Vince Gilligan",
+        "elenco_principal": "Bryan Cranston, Aaron Paul",
+        "total_temporadas": 5,
+    },
+}
+
+
+def make_rows(n, seed=42):
+    rng = random.Random(seed)
+    categories = list(SAMPLE_METADATA)
+    rows = []
+    for i in range(n):
+        category = rng.choice(categories)
+        metadata = SAMPLE_METADATA[category]
+        rows.append(
+            {
+                "id": i,
+                "categoria": category,
+                "titulo": f"Titulo {i}",
+                "descricao": "Lorem ipsum dolor sit amet. " * rng.randint(1, 20),
+                "ano_lancamento": rng.randint(1950, 2025),
+                "imagem": f"https://img.example/{i}.jpg",
+                "metadata": json.dumps(metadata) if i % 5 == 0 else metadata,
+                "generos": ["Ação", "Drama"],
+                "generos_unificados": ["Ação", "Drama"],
+                "classificacao": rng.choice([None, 10, 14, 16, 18]),
+            }
+        )
+    return rows
+
+
+def pydantic_encode(row):
+    return json_encode_item(ListItemsItem(**row))
+
+
+def bench(encoder, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for row in rows:
+            encoder(row)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    mismatches = sum(pydantic_encode(r) != encode_midia_row(r) for r in rows)
+    if mismatches:
+        raise SystemExit(f"{mismatches} rows differ between encoders")
+
+    slow = bench(pydantic_encode, rows, args.repeat)
+    fast = bench(encode_midia_row, rows, args.repeat)
+    print(f"pydantic : {slow:>12,.0f} rows/s")
+    print(f"fast path: {fast:>12,.0f} rows/s ({fast / slow:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark of the recommendation job's similarity stage on synthetic ratings.
+
+Each size runs in its own process so the reported peak RSS belongs to that
+size alone. Run from the repository root:
+    PYTHONPATH=src/layers/common_layer:jobs python benchmarks/similarity_stage.py
+
+Add --changed-users N to also time an incremental run after N users
+rewrite their libraries.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from similarity import calculate_recomendations, update_recommendations
+from synthetic import make_catalog, make_ratings
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rewrite_libraries(ratings, catalog, n_users, seed):
+    """Replaces the libraries of `n_users` random users with fresh draws."""
+    rng = np.random.default_rng(seed)
+    users = rng.choice(ratings["user_id"].unique(), n_users, replace=False)
+    rewritten = make_ratings(
+        int(ratings["user_id"].isin(users).sum()) or n_users,
+        catalog,
+        n_users=n_users,
+        seed=seed,
+    )
+    rewritten["user_id"] = users[rewritten["user_id"].str[1:].astype(int)]
+    kept = ratings[~ratings["user_id"].isin(users)]
+    return pd.concat([kept, rewritten], ignore_index=True)
+
+
+def run_size(n_ratings, items_per_rating, changed_users, seed, results):
+    catalog = make_catalog(max(int(n_ratings * items_per_rating), 100), seed=seed)
+    ratings = make_ratings(n_ratings, catalog, seed=seed)
+
+    start = time.perf_counter()
+    recommendations = calculate_recomendations(ratings)
+    result = {
+        "ratings": len(ratings),
+        "users": ratings["user_id"].nunique(),
+        "items": ratings.groupby(["categoria", "item_id"]).ngroups,
+        "seconds": time.perf_counter() - start,
+        "rows": len(recommendations),
+    }
+
+    if changed_users:
+        updated = rewrite_libraries(ratings, catalog, changed_users, seed + 1)
+        start = time.perf_counter()
+        update_recommendations(ratings, recommendations, updated)
+        result["incremental_seconds"] = time.perf_counter() - start
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    results.put(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--items-per-rating", type=float, default=0.05)
+    parser.add_argument("--changed-users", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    header = f"{'ratings':>10} {'users':>8} {'items':>8} {'seconds':>9} {'rows':>10} {'peak MB':>9}"
+    if args.changed_users:
+        header += f" {'incr. s':>9}"
+    print(header)
+
+    for size in args.sizes:
+        results = ctx.Queue()
+        worker = ctx.Process(
+            target=run_size,
+            args=(size, args.items_per_rating, args.changed_users, args.seed, results),
+        )
+        worker.start()
+        result = results.get()
+        worker.join()
+
+        line = (
+            f"{result['ratings']:>10,} {result['users']:>8,} {result['items']:>8,} "
+            f"{result['seconds']:>9.2f} {result['rows']:>10,} "
+            f"{result['peak_rss_mb']:>9.0f}"
+        )
+        if args.changed_users:
+            line += f" {result['incremental_seconds']:>9.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Synthetic catalog, libraries and ratings for the recommendation benchmarks.
+
+Item popularity and user activity both follow power laws, so a handful of
+titles collect most of the ratings and a few users rate far more than the
+rest, as in the real table. Items are spread over CATEGORIES_AVAILABLE and
+get unified genres from GENRE_VOCABULARY.
+"""
+
+import numpy as np
+import pandas as pd
+
+from common.configs import CATEGORIES_AVAILABLE
+from common.genres import GENRE_VOCABULARY
+
+RATING_VALUES = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+RATING_WEIGHTS = np.array([0.05, 0.1, 0.25, 0.35, 0.25])
+
+
+def power_law(n, alpha, rng):
+    """Probabilities proportional to 1/rank**alpha, in random order."""
+    weights = 1.0 / np.arange(1, n + 1) ** alpha
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def make_catalog(n_items, seed=0, genres_per_item=3):
+    """`midia`-like rows: id, categoria, titulo, rating and generos_unificados."""
+    rng = np.random.default_rng(seed)
+    categories = rng.choice(CATEGORIES_AVAILABLE, n_items)
+    return pd.DataFrame(
+        {
+            "id": np.arange(1, n_items + 1),
+            "categoria": categories,
+            "titulo": [f"Titulo {i}" for i in range(1, n_items + 1)],
+            "ano_lancamento": rng.integers(1950, 2026, n_items),
+            "rating": np.round(rng.uniform(1, 5, n_items), 2),
+            "generos_unificados": [
+                sorted(set(rng.choice(GENRE_VOCABULARY, genres_per_item).tolist()))
+                for _ in categories
+            ],
+        }
+    )
+
+
+def make_ratings(
+    n_ratings, catalog, n_users=None, item_alpha=1.0, user_alpha=0.8, seed=0
+):
+    """
+    Ratings rows (user_id, categoria, item_id, rating) as the job extracts
+    them. Duplicate (user, item) draws are dropped, so slightly fewer than
+    `n_ratings` rows come back for very skewed distributions.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(n_ratings // 40, 1)
+    items = rng.choice(
+        len(catalog), n_ratings, p=power_law(len(catalog), item_alpha, rng)
+    )
+    users = rng.choice(n_users, n_ratings, p=power_law(n_users, user_alpha, rng))
+
+    df = pd.DataFrame({"user": users, "item": items}).drop_duplicates()
+    return pd.DataFrame(
+        {
+            "user_id": "u" + df["user"].astype(str),
+            "categoria": catalog["categoria"].to_numpy()[df["item"]],
+            "item_id": catalog["id"].to_numpy()[df["item"]].astype(str),
+            "rating": rng.choice(RATING_VALUES, len(df), p=RATING_WEIGHTS),
+        }
+    ).reset_index(drop=True)
+
+
+def to_library_items(ratings):
+    """Groups ratings rows into per-user DynamoDB library items."""
+    histories = {}
+    for row in ratings.itertuples(index=False):
+        histories.setdefault(row.user_id, []).append(
+            {
+                "sk": f"item#{row.categoria}#{row.item_id}",
+                "rating": row.rating,
+                "status": "completed",
+            }
+        )
+    return histories
@@ -1,15 +1,33 @@
+import argparse
 import os
 import boto3
-from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
-from sklearn.metrics.pairwise import cosine_similarity
-from common.configs import CATEGORIES_AVAILABLE
+from common.dynamo_client import DynamoClient
+from similarity import (
+    RATING_COLUMNS,
+    RECOMMENDATION_COLUMNS,
+    calculate_recomendations,
+    to_ratings_frame,
+    update_recommendations,
+)
+from snapshots import (
+    NEIGHBOURS,
+    RATINGS,
+    REVISIONS,
+    STATE_DIR,
+    has_state,
+    load_frame,
+    read_manifest,
+    save_frame,
+    write_manifest,
+)
+from tenacity import retry, stop_after_attempt, wait_exponential
 import pandas as pd
 
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
-dynamodb = boto3.resource("dynamodb")
 
 
 def get_table_name_from_ssm():
@@ -18,15 +36,20 @@ def get_table_name_from_ssm():
     return response["Parameter"]["Value"]
 
 
-table = dynamodb.Table(get_table_name_from_ssm())
+dynamo = DynamoClient(get_table_name_from_ssm())
 
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-CATEGORIAS_ALVO = CATEGORIES_AVAILABLE.copy()
-LIMIT_PER_CATEGORY = 10
+PROFILE_PROJECTION = ["user_id", "sk", "rating", "status"]
+EXTRACTION_MODE = os.getenv("PROFILE_EXTRACTION_MODE", "query")
+EXTRACTION_WORKERS = int(os.getenv("PROFILE_EXTRACTION_WORKERS", 16))
+SCAN_SEGMENTS = int(os.getenv("PROFILE_SCAN_SEGMENTS", 8))
+INCREMENTAL = os.getenv("RECS_INCREMENTAL", "0") == "1"
+UPLOAD_BATCH_SIZE = int(os.getenv("RECS_UPLOAD_BATCH_SIZE", 1000))
+UPLOAD_WORKERS = int(os.getenv("RECS_UPLOAD_WORKERS", 4))
 
 
 def fetch_all_cognito_users():
@@ -49,115 +72,259 @@ def fetch_all_cognito_users():
     return users
 
 
+def to_profile_row(user_id, item):
+    """Maps a library item to a ratings row, or None if it shouldn't count."""
+    sk = item.get("sk").split("#")
+    item_id = sk[-1]
+    categoria = sk[-2]
+    rating = float(item["rating"]) if item.get("rating") is not None else 0
+    status = str(item["status"]) if item.get("status") else "planned"
+
+    if rating <= 0 or status in ["planned", "abandoned"]:
+        return None
+    return {
+        "user_id": user_id,
+        "categoria": categoria,
+        "item_id": item_id,
+        "rating": rating,
+    }
+
+
 def get_profile(user_id):
-    key_condition = Key("user_id").eq(str(user_id)) & Key("sk").begins_with("item#")
-    response = table.query(KeyConditionExpression=key_condition)
-    items = response.get("Items", [])
     profile = []
-    for item in items:
-        sk = item.get("sk").split("#")
-        item_id = sk[-1]
-        categoria = sk[-2]
-        rating = float(item["rating"]) if item.get("rating") is not None else 0
-        status = str(item["status"]) if item.get("status") else "planned"
-
-        if rating <= 0 or status in ["planned", "abandoned"]:
-            continue
-        profile.append(
-            {
-                "user_id": user_id,
-                "categoria": categoria,
-                "item_id": item_id,
-                "rating": rating,
-            }
-        )
+    for item in dynamo.iter_query(user_id, "item#", projection=PROFILE_PROJECTION):
+        row = to_profile_row(user_id, item)
+        if row:
+            profile.append(row)
     return profile
 
 
-def calculate_recomendations(raw_data):
-    df = pd.DataFrame(raw_data)
-    df["unique_id"] = df["categoria"] + "_" + df["item_id"].astype(str)
-    meta_lookup = (
-        df[["unique_id", "categoria", "item_id"]]
-        .drop_duplicates()
-        .set_index("unique_id")
-        .to_dict("index")
+def extract_profiles(user_ids, max_workers=EXTRACTION_WORKERS):
+    """Queries every user's full history concurrently (one paginated Query each)."""
+    raw_data = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for profile in executor.map(get_profile, user_ids):
+            raw_data.extend(profile)
+    return raw_data
+
+
+def scan_segment_profiles(segment, total_segments):
+    rows = []
+    for item in dynamo.iter_scan_segment(
+        segment, total_segments, sk_prefix="item#", projection=PROFILE_PROJECTION
+    ):
+        row = to_profile_row(item["user_id"], item)
+        if row:
+            rows.append(row)
+    return rows
+
+
+def scan_profiles(total_segments=SCAN_SEGMENTS):
+    """
+    Reads every library item with a parallel Scan (Segment/TotalSegments).
+    Cheaper than per-user queries once most users have items, and it doesn't
+    need the Cognito user list.
+    """
+    raw_data = []
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        for rows in executor.map(
+            scan_segment_profiles,
+            range(total_segments),
+            [total_segments] * total_segments,
+        ):
+            raw_data.extend(rows)
+    return raw_data
+
+
+def fetch_revisions(user_ids, max_workers=EXTRACTION_WORKERS):
+    """Library revision (meta#rev) of every user, -1 for users that never wrote one."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        revs = list(executor.map(dynamo.get_revision, user_ids))
+    return pd.DataFrame(
+        {
+            "user_id": list(user_ids),
+            "rev": [-1 if rev is None else rev for rev in revs],
+        }
     )
 
-    pivot_table = df.pivot_table(
-        index="user_id", columns="unique_id", values="rating"
-    ).fillna(0)
 
-    item_matrix = pivot_table.T
-    similarity_matrix = cosine_similarity(item_matrix)
-
-    similarity_df = pd.DataFrame(
-        similarity_matrix, index=item_matrix.index, columns=item_matrix.index
+def changed_users(revisions, previous_revisions):
+    merged = revisions.merge(
+        previous_revisions, on="user_id", how="left", suffixes=("", "_prev")
+    )
+    return merged.loc[merged["rev"] != merged["rev_prev"], "user_id"].tolist()
+
+
+def extract_ratings(previous_ratings=None, previous_revisions=None):
+    """
+    Returns (ratings, revisions). In query mode, when the previous run left
+    its ratings and revisions behind, only users whose meta#rev moved are
+    queried again; everyone else keeps their previous rows.
+    """
+    if EXTRACTION_MODE == "scan":
+        return to_ratings_frame(scan_profiles()), None
+
+    user_ids = fetch_all_cognito_users()
+    revisions = fetch_revisions(user_ids)
+    if previous_ratings is None or previous_revisions is None:
+        return to_ratings_frame(extract_profiles(user_ids)), revisions
+
+    changed = changed_users(revisions, previous_revisions)
+    print(f"{len(changed)} de {len(user_ids)} usuários alteraram a biblioteca")
+    kept = previous_ratings[
+        previous_ratings["user_id"].isin(user_ids)
+        & ~previous_ratings["user_id"].isin(changed)
+    ]
+    fresh = to_ratings_frame(extract_profiles(changed))
+    return pd.concat([kept, fresh], ignore_index=True), revisions
+
+
+def diff_recommendations(previous, current):
+    """
+    Compares two neighbour tables. Returns (upserts, deletes): the pairs that
+    are new or whose score changed, and the keys of the pairs that are gone.
+    """
+    key = RECOMMENDATION_COLUMNS[:4]
+    merged = previous.merge(
+        current, on=key, how="outer", suffixes=("_old", ""), indicator=True
+    )
+    inserted = merged["_merge"] == "right_only"
+    updated = (merged["_merge"] == "both") & (merged["score"] != merged["score_old"])
+    removed = merged["_merge"] == "left_only"
+    print(
+        f"{inserted.sum()} inserções, {updated.sum()} atualizações, "
+        f"{removed.sum()} remoções"
     )
+    return (
+        merged.loc[inserted | updated, RECOMMENDATION_COLUMNS],
+        merged.loc[removed, key],
+    )
+
 
-    recommends_list = []
-
-    for source_unique_id in similarity_df.columns:
-
-        source_meta = meta_lookup[source_unique_id]
-        scores = similarity_df[source_unique_id].sort_values(ascending=False)
-        counts = {cat: 0 for cat in CATEGORIAS_ALVO}
-
-        for target_unique_id, score in scores.items():
-            if target_unique_id == source_unique_id:
-                continue
-            if score < 0.1:
-                break
-
-            target_meta = meta_lookup[target_unique_id]
-            target_cat = target_meta["categoria"]
-
-            if (
-                target_cat in CATEGORIAS_ALVO
-                and counts[target_cat] < LIMIT_PER_CATEGORY
-            ):
-
-                recommends_list.append(
-                    {
-                        "origem_id": source_meta["item_id"],
-                        "origem_categoria": source_meta["categoria"],
-                        "alvo_id": target_meta["item_id"],
-                        "alvo_categoria": target_cat,
-                        "score": round(score, 4),
-                    }
-                )
-                counts[target_cat] += 1
-            if all(c >= LIMIT_PER_CATEGORY for c in counts.values()):
-                break
-    return recommends_list
-
-
-def upload_to_supabase(data_list, batch_size=1000):
-    total = len(data_list)
-    for i in range(0, total, batch_size):
-        batch = data_list[i : i + batch_size]
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=0.5, min=0.5, max=10),
+    reraise=True,
+)
+def upsert_batch(batch):
+    supabase.table("recommendations").upsert(
+        batch,
+        on_conflict="origem_id, origem_categoria, alvo_id, alvo_categoria",
+        ignore_duplicates=False,
+    ).execute()
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=0.5, min=0.5, max=10),
+    reraise=True,
+)
+def delete_batch(batch):
+    supabase.rpc("delete_recommendations", {"p_pairs": batch}).execute()
+
+
+def send_batches(
+    operation, frame, batch_size=UPLOAD_BATCH_SIZE, max_workers=UPLOAD_WORKERS
+):
+    """
+    Sends `frame` in batches of `batch_size` rows, `max_workers` at a time.
+    Every batch is tried (with retries) before raising, so a failure leaves
+    as little as possible for the next run.
+    """
+
+    def send(start):
+        batch = frame.iloc[start : start + batch_size].to_dict("records")
         try:
-            response = (
-                supabase.table("recommendations")
-                .upsert(
-                    batch,
-                    on_conflict="origem_id, origem_categoria, alvo_id, alvo_categoria",
-                    ignore_duplicates=False,
-                )
-                .execute()
-            )
-            print(f"Lote {i} a {i+len(batch)} enviado com sucesso!")
+            operation(batch)
         except Exception as e:
-            print(f"Erro no lote {i}: {e}")
-
-
-def main():
-    cognito_users = fetch_all_cognito_users()
-    raw_data = []
-    for user_id in cognito_users:
-        raw_data.extend(get_profile(user_id))
-    recommends_list = calculate_recomendations(raw_data)
-    upload_to_supabase(recommends_list)
+            print(f"Erro no lote {start} a {start + len(batch)}: {e}")
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(send, range(0, len(frame), batch_size)))
+    if not all(results):
+        raise RuntimeError(f"{results.count(False)} lotes falharam")
+
+
+def upload_to_supabase(recommendations, previous=None):
+    """
+    Without a previous neighbour table every row is upserted. Otherwise only
+    the difference is sent: new and rescored pairs are upserted and vanished
+    pairs deleted.
+    """
+    if previous is None:
+        send_batches(upsert_batch, recommendations)
+        return
+    upserts, deletes = diff_recommendations(previous, recommendations)
+    send_batches(upsert_batch, upserts)
+    send_batches(delete_batch, deletes)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Recalcula a tabela de recomendações item-item."
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        default=STATE_DIR,
+        help="Diretório com o estado da última execução (ratings/vizinhos).",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        action="store_true",
+        help="Usa as avaliações do snapshot em vez de extraí-las do DynamoDB "
+        "e recalcula todas as similaridades.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Grava avaliações e vizinhos neste diretório e não envia nada ao "
+        "Supabase (o estado em --snapshot-dir fica intacto).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    state_dir = args.snapshot_dir
+    previous_neighbours = load_frame(NEIGHBOURS, state_dir)
+
+    if args.from_snapshot:
+        ratings = load_frame(RATINGS, state_dir, columns=RATING_COLUMNS)
+        if ratings is None:
+            raise SystemExit(f"Nenhum snapshot de avaliações em {state_dir}")
+        print(f"Snapshot: {read_manifest(state_dir)}")
+        revisions = load_frame(REVISIONS, state_dir)
+        recommendations = calculate_recomendations(ratings)
+    else:
+        incremental = INCREMENTAL and has_state(state_dir)
+        previous_ratings = load_frame(RATINGS, state_dir) if incremental else None
+        previous_revisions = load_frame(REVISIONS, state_dir) if incremental else None
+
+        ratings, revisions = extract_ratings(previous_ratings, previous_revisions)
+        if incremental:
+            recommendations = update_recommendations(
+                previous_ratings, previous_neighbours, ratings
+            )
+        else:
+            recommendations = calculate_recomendations(ratings)
+
+    if args.output_dir:
+        state_dir = args.output_dir
+    else:
+        upload_to_supabase(recommendations, previous_neighbours)
+
+    save_frame(ratings, RATINGS, state_dir)
+    save_frame(recommendations, NEIGHBOURS, state_dir)
+    if revisions is not None:
+        save_frame(revisions, REVISIONS, state_dir)
+    write_manifest(
+        state_dir,
+        extraction_mode="snapshot" if args.from_snapshot else EXTRACTION_MODE,
+        ratings=len(ratings),
+        users=ratings["user_id"].nunique(),
+        neighbours=len(recommendations),
+    )
 
 
 if __name__ == "__main__":
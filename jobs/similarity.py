@@ -0,0 +1,319 @@
+"""
+The similarity stage of the recommendation job: item-item cosine
+neighbours over the items x users ratings matrix. Kept free of AWS and
+Supabase clients so it can run from snapshots and benchmarks.
+"""
+
+import os
+from common.configs import CATEGORIES_AVAILABLE
+import scipy.sparse as sp
+import pandas as pd
+import numpy as np
+
+CATEGORIAS_ALVO = CATEGORIES_AVAILABLE.copy()
+LIMIT_PER_CATEGORY = 10
+MIN_SCORE = 0.1
+SIMILARITY_BLOCK_ROWS = int(os.getenv("SIMILARITY_BLOCK_ROWS", 2048))
+RATING_COLUMNS = ["user_id", "categoria", "item_id", "rating"]
+RECOMMENDATION_COLUMNS = [
+    "origem_id",
+    "origem_categoria",
+    "alvo_id",
+    "alvo_categoria",
+    "score",
+]
+
+
+def to_ratings_frame(raw_data):
+    df = pd.DataFrame(raw_data, columns=RATING_COLUMNS)
+    df["item_id"] = df["item_id"].astype(str)
+    df["rating"] = df["rating"].astype(float)
+    return df
+
+
+def build_ratings_matrix(raw_data):
+    """
+    Builds the items x users CSR ratings matrix (duplicated ratings averaged)
+    plus the categoria/item_id arrays aligned with its rows.
+    """
+    df = pd.DataFrame(raw_data, columns=RATING_COLUMNS)
+    df["unique_id"] = df["categoria"] + "_" + df["item_id"].astype(str)
+    df = df.groupby(["unique_id", "user_id"], as_index=False, sort=False).agg(
+        rating=("rating", "mean"),
+        categoria=("categoria", "first"),
+        item_id=("item_id", "first"),
+    )
+
+    item_codes, item_index = pd.factorize(df["unique_id"])
+    user_codes, user_index = pd.factorize(df["user_id"])
+    ratings = sp.csr_matrix(
+        (df["rating"].to_numpy(dtype=np.float32), (item_codes, user_codes)),
+        shape=(len(item_index), len(user_index)),
+    )
+
+    first_rows = df.drop_duplicates("unique_id")
+    categorias = first_rows["categoria"].to_numpy()
+    item_ids = first_rows["item_id"].astype(str).to_numpy()
+    return ratings, categorias, item_ids
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms).astype(np.float32) @ matrix
+
+
+def iter_similarity_blocks(normalized, rows=None, block_rows=SIMILARITY_BLOCK_ROWS):
+    """
+    Yields (block_sources, block) with block = cosine similarities of
+    `block_rows` items (the matrix rows in block_sources) against every item,
+    as a sparse CSR matrix. Only pairs that share at least one user are
+    materialized. `rows` restricts the sources to a subset of the items.
+    """
+    if rows is None:
+        rows = np.arange(normalized.shape[0])
+    transposed = normalized.T.tocsr()
+    for start in range(0, len(rows), block_rows):
+        block_sources = rows[start : start + block_rows]
+        block = normalized[block_sources] @ transposed
+        yield block_sources, block.tocsr()
+
+
+def exclude_self_and_floor(block, block_sources):
+    """Drops self-similarity and scores below MIN_SCORE from a CSR block, in place."""
+    rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+    drop = (block.indices == block_sources[rows]) | (block.data < MIN_SCORE)
+    block.data[drop] = 0
+    block.eliminate_zeros()
+    return block
+
+
+def top_k_per_row(matrix, k):
+    """
+    Per-row top-k of a CSR matrix without Python loops, in O(nnz) memory.
+    Rows with at most k non-zeros are kept whole; the others are sorted by
+    (row, -score) and cut at k using their indptr spans. Returns (row, col,
+    score) arrays.
+    """
+    lengths = np.diff(matrix.indptr)
+    row_ids = np.repeat(np.arange(matrix.shape[0]), lengths)
+    long_rows = lengths > k
+    if not long_rows.any():
+        return row_ids, matrix.indices, matrix.data
+
+    in_long = long_rows[row_ids]
+    short = np.flatnonzero(~in_long)
+    candidates = np.flatnonzero(in_long)
+    # Scores lie in (0, 1], so row * 4 - score orders rows first and keeps
+    # every row's entries inside its own band.
+    order = candidates[np.argsort(row_ids[candidates] * 4.0 - matrix.data[candidates])]
+    spans = np.cumsum(lengths[long_rows]) - lengths[long_rows]
+    rank = np.arange(len(order)) - np.repeat(spans, lengths[long_rows])
+    keep = np.concatenate([short, order[rank < k]])
+    return row_ids[keep], matrix.indices[keep], matrix.data[keep]
+
+
+def category_columns_of(categorias):
+    return {cat: np.flatnonzero(categorias == cat) for cat in CATEGORIAS_ALVO}
+
+
+def block_neighbours(block, block_sources, category_columns):
+    """Per-category top-k of a filtered block as (source, target, score) arrays."""
+    parts = []
+    for columns in category_columns.values():
+        if not len(columns):
+            continue
+        hits, cols, values = top_k_per_row(block[:, columns], LIMIT_PER_CATEGORY)
+        parts.append((block_sources[hits], columns[cols], values))
+    return parts
+
+
+def neighbours_frame(sources, targets, scores, categorias, item_ids):
+    return pd.DataFrame(
+        {
+            "origem_id": item_ids[sources],
+            "origem_categoria": categorias[sources],
+            "alvo_id": item_ids[targets],
+            "alvo_categoria": categorias[targets],
+            "score": np.round(np.asarray(scores, dtype=np.float64), 4),
+        },
+        columns=RECOMMENDATION_COLUMNS,
+    )
+
+
+def parts_frame(parts, categorias, item_ids):
+    if not parts:
+        return pd.DataFrame(columns=RECOMMENDATION_COLUMNS)
+    sources, targets, scores = (np.concatenate(arrays) for arrays in zip(*parts))
+    return neighbours_frame(sources, targets, scores, categorias, item_ids)
+
+
+def compute_neighbours(ratings, categorias, item_ids, rows=None):
+    """
+    Returns the neighbour lists of the given item rows (all of them by
+    default) as a columnar DataFrame with origem_id, origem_categoria,
+    alvo_id, alvo_categoria and score.
+    """
+    normalized = normalize_rows(ratings)
+    category_columns = category_columns_of(categorias)
+
+    parts = []
+    for block_sources, block in iter_similarity_blocks(normalized, rows):
+        block = exclude_self_and_floor(block, block_sources)
+        parts.extend(block_neighbours(block, block_sources, category_columns))
+    return parts_frame(parts, categorias, item_ids)
+
+
+def calculate_recomendations(raw_data):
+    return compute_neighbours(*build_ratings_matrix(raw_data))
+
+
+def unique_ids(categorias, item_ids):
+    return pd.Series(categorias).astype(str) + "_" + pd.Series(item_ids).astype(str)
+
+
+def affected_items(previous_ratings, ratings):
+    """unique_ids of the items whose rating vector differs between the two runs."""
+    merged = previous_ratings.merge(
+        ratings,
+        on=["user_id", "categoria", "item_id"],
+        how="outer",
+        suffixes=("_old", "_new"),
+    )
+    changed = merged[merged["rating_old"].ne(merged["rating_new"])]
+    return pd.Index(unique_ids(changed["categoria"], changed["item_id"]).unique())
+
+
+def changed_pairs(normalized, categorias, affected_rows):
+    """
+    Runs the similarity stage for the affected rows only. Returns their new
+    neighbour list parts and, since cosine similarity is symmetric, every
+    pair whose score moved as a (row, alvo, score) frame seen from the other
+    item's side.
+    """
+    category_columns = category_columns_of(categorias)
+    parts, rows, alvos, scores = [], [], [], []
+    for block_sources, block in iter_similarity_blocks(normalized, affected_rows):
+        block = exclude_self_and_floor(block, block_sources)
+        parts.extend(block_neighbours(block, block_sources, category_columns))
+        rows.append(block.indices)
+        alvos.append(
+            block_sources[np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))]
+        )
+        scores.append(block.data)
+
+    pairs = pd.DataFrame(
+        {
+            "row": np.concatenate(rows or [np.empty(0, dtype=np.int64)]),
+            "alvo": np.concatenate(alvos or [np.empty(0, dtype=np.int64)]),
+            "score": np.concatenate(scores or [np.empty(0, dtype=np.float32)]),
+        }
+    )
+    pairs["alvo_categoria"] = categorias[pairs["alvo"].to_numpy()]
+    return parts, pairs
+
+
+def rows_to_recompute(touched, pairs):
+    """
+    Rows of `touched` (previous lists with a `row` and a `dropped` flag for
+    neighbours that are affected items) whose new list can't be derived from
+    what is known. A full list's unlisted items all scored at most its last
+    entry and didn't move, so kept entries plus changed pairs reaching that
+    score settle the list as long as they still fill it.
+    """
+    group = ["row", "alvo_categoria"]
+    lists = (
+        touched.assign(kept=~touched["dropped"])
+        .groupby(group)
+        .agg(size=("score", "size"), last=("score", "min"), kept=("kept", "sum"))
+    )
+    full = lists[lists["size"] >= LIMIT_PER_CATEGORY]
+    reaching = pairs.merge(full["last"].reset_index(), on=group)
+    reaching = reaching[reaching["score"] >= reaching["last"]].groupby(group).size()
+    known = full["kept"].add(reaching, fill_value=0)
+    short = known[known < LIMIT_PER_CATEGORY]
+    return np.unique(short.index.get_level_values("row").to_numpy())
+
+
+def update_recommendations(previous_ratings, previous_neighbours, ratings):
+    """
+    Incremental counterpart of calculate_recomendations. Only pairs involving
+    an affected item change score, so the similarity stage runs for the
+    affected rows; the lists of other rows that gained or lost one of those
+    pairs are merged from their kept entries, and rows_to_recompute picks
+    the few that need a full pass. Everything else is carried over.
+    """
+    affected = affected_items(previous_ratings, ratings)
+    if not len(affected):
+        return previous_neighbours
+
+    matrix, categorias, item_ids = build_ratings_matrix(ratings)
+    item_keys = pd.Index(unique_ids(categorias, item_ids))
+    is_affected = item_keys.isin(affected)
+    normalized = normalize_rows(matrix)
+    own_parts, pairs = changed_pairs(
+        normalized, categorias, np.flatnonzero(is_affected)
+    )
+    pairs = pairs[~is_affected[pairs["row"].to_numpy()]]
+
+    origins = unique_ids(
+        previous_neighbours["origem_categoria"], previous_neighbours["origem_id"]
+    )
+    targets = unique_ids(
+        previous_neighbours["alvo_categoria"], previous_neighbours["alvo_id"]
+    )
+    previous = previous_neighbours.assign(
+        row=item_keys.get_indexer(origins),
+        alvo=item_keys.get_indexer(targets),
+        dropped=targets.isin(affected).to_numpy(),
+    )
+    previous = previous[previous["row"] >= 0]
+    previous = previous[~is_affected[previous["row"].to_numpy()]]
+
+    touched_rows = np.union1d(
+        pairs["row"].unique(), previous.loc[previous["dropped"], "row"].unique()
+    )
+    is_touched = previous["row"].isin(touched_rows)
+    untouched = previous[~is_touched]
+    touched = previous[is_touched]
+
+    recompute = rows_to_recompute(touched, pairs)
+    print(
+        f"{len(affected)} itens alterados, {len(touched_rows)} listas atualizadas, "
+        f"{len(recompute)} recalculadas"
+    )
+
+    merged = pd.concat(
+        [
+            touched.loc[~touched["dropped"], ["row", "alvo", "score"]],
+            pairs[["row", "alvo", "score"]].assign(
+                score=np.round(pairs["score"].to_numpy(dtype=np.float64), 4)
+            ),
+        ],
+        ignore_index=True,
+    )
+    merged = merged[~merged["row"].isin(recompute)]
+    merged["alvo_categoria"] = categorias[merged["alvo"].to_numpy()]
+    merged = (
+        merged.sort_values(
+            ["row", "alvo_categoria", "score"], ascending=[True, True, False]
+        )
+        .groupby(["row", "alvo_categoria"], sort=False)
+        .head(LIMIT_PER_CATEGORY)
+    )
+
+    return pd.concat(
+        [
+            untouched[RECOMMENDATION_COLUMNS],
+            neighbours_frame(
+                merged["row"].to_numpy(),
+                merged["alvo"].to_numpy(),
+                merged["score"].to_numpy(),
+                categorias,
+                item_ids,
+            ),
+            compute_neighbours(matrix, categorias, item_ids, recompute),
+            parts_frame(own_parts, categorias, item_ids),
+        ],
+        ignore_index=True,
+    )
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+import json
+import os
+import pandas as pd
+
+STATE_DIR = os.getenv(
+    "RECS_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+)
+
+RATINGS = "ratings"
+REVISIONS = "revisions"
+NEIGHBOURS = "neighbours"
+MANIFEST = "manifest.json"
+
+
+def _path(name, state_dir):
+    return os.path.join(state_dir, f"{name}.parquet")
+
+
+def save_frame(df, name, state_dir=STATE_DIR):
+    """Writes a DataFrame to `<state_dir>/<name>.parquet` atomically."""
+    os.makedirs(state_dir, exist_ok=True)
+    path = _path(name, state_dir)
+    df.to_parquet(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_frame(name, state_dir=STATE_DIR, columns=None):
+    """
+    Returns the saved DataFrame, or None if the job never persisted it. The
+    file is memory-mapped, so `columns` only pages in what is asked for.
+    """
+    path = _path(name, state_dir)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path, columns=columns, memory_map=True)
+
+
+def write_manifest(state_dir=STATE_DIR, **info):
+    """Records when and how the snapshot in `state_dir` was produced."""
+    os.makedirs(state_dir, exist_ok=True)
+    manifest = {"created_at": datetime.now(timezone.utc).isoformat(), **info}
+    with open(os.path.join(state_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+
+def read_manifest(state_dir=STATE_DIR):
+    path = os.path.join(state_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def has_state(state_dir=STATE_DIR):
+    return all(os.path.exists(_path(name, state_dir)) for name in (RATINGS, NEIGHBOURS))
@@ -0,0 +1,26 @@
+CREATE OR REPLACE FUNCTION public.delete_recommendations(
+  p_pairs jsonb
+)
+RETURNS integer
+LANGUAGE plpgsql
+SET search_path TO public, pg_catalog
+AS $$
+DECLARE
+  v_deleted integer;
+BEGIN
+  DELETE FROM recommendations r
+  USING jsonb_to_recordset(p_pairs) AS p(
+    origem_id bigint,
+    origem_categoria text,
+    alvo_id bigint,
+    alvo_categoria text
+  )
+  WHERE r.origem_id = p.origem_id
+    AND r.origem_categoria::text = p.origem_categoria
+    AND r.alvo_id = p.alvo_id
+    AND r.alvo_categoria::text = p.alvo_categoria;
+
+  GET DIAGNOSTICS v_deleted = ROW_COUNT;
+  RETURN v_deleted;
+END;
+$$;
@@ -0,0 +1,55 @@
+-- Top-rated candidates per (genre, category), read by the fallback of the
+-- recommendation endpoints and merged with the user's genre weights in Python.
+-- genero = '*' holds the overall top-rated items of each category, used when
+-- the user has no genre weights. Rows carry the columns the endpoints return,
+-- so the fallback needs no second read of `midia`. 100 rows per category keep
+-- a genre's list (6 categories) under PostgREST's 1000-row response cap.
+CREATE MATERIALIZED VIEW public.fallback_candidates AS
+SELECT per_genre.genero, per_genre.pos, per_genre.id, per_genre.titulo,
+       per_genre.categoria, per_genre.ano_lancamento, per_genre.imagem,
+       per_genre.metadata, per_genre.generos_unificados, per_genre.rating
+FROM (
+  SELECT
+    g.genero,
+    row_number() OVER (
+      PARTITION BY g.genero, m.categoria
+      ORDER BY m.rating DESC, m.id
+    ) AS pos,
+    m.id, m.titulo, m.categoria, m.ano_lancamento, m.imagem,
+    m.metadata, m.generos_unificados, m.rating
+  FROM public.midia m
+  CROSS JOIN LATERAL unnest(m.generos_unificados) AS g(genero)
+  WHERE COALESCE(m.rating, 0) >= 2.0
+) per_genre
+WHERE per_genre.pos <= 100
+UNION ALL
+SELECT overall.genero, overall.pos, overall.id, overall.titulo,
+       overall.categoria, overall.ano_lancamento, overall.imagem,
+       overall.metadata, overall.generos_unificados, overall.rating
+FROM (
+  SELECT
+    '*'::text AS genero,
+    row_number() OVER (
+      PARTITION BY m.categoria
+      ORDER BY m.rating DESC NULLS LAST, m.id
+    ) AS pos,
+    m.id, m.titulo, m.categoria, m.ano_lancamento, m.imagem,
+    m.metadata, m.generos_unificados, m.rating
+  FROM public.midia m
+) overall
+WHERE overall.pos <= 100;
+
+CREATE UNIQUE INDEX fallback_candidates_key
+ON public.fallback_candidates (genero, categoria, id);
+
+
+-- Called at the end of the ETL, once `midia` is up to date.
+CREATE OR REPLACE FUNCTION public.refresh_fallback_candidates()
+RETURNS void
+LANGUAGE plpgsql
+SET search_path TO public, pg_catalog
+AS $$
+BEGIN
+  REFRESH MATERIALIZED VIEW CONCURRENTLY public.fallback_candidates;
+END;
+$$;
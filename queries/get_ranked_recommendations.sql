@@ -0,0 +1,53 @@
+CREATE OR REPLACE FUNCTION public.get_ranked_recommendations(
+  source_ids bigint[],
+  source_types text[],
+  seen_ids bigint[],
+  per_category int DEFAULT 36
+)
+RETURNS TABLE (
+  alvo_id bigint,
+  alvo_categoria item_categoria,
+  score float4,
+  sources int
+)
+LANGUAGE plpgsql
+SET search_path TO public, pg_catalog
+AS $$
+BEGIN
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT
+      r.alvo_id,
+      r.alvo_categoria,
+      SUM(r.score)::float4 AS total_score,
+      COUNT(*)::int AS source_count
+    FROM recommendations r
+    JOIN (
+      SELECT i1.val AS id, i2.val AS typ
+      FROM unnest(source_ids) WITH ORDINALITY AS i1(val, ord)
+      LEFT JOIN unnest(source_types) WITH ORDINALITY AS i2(val, ord) USING (ord)
+    ) s2 ON r.origem_id = s2.id
+        AND r.origem_categoria::text = s2.typ
+    LEFT JOIN unnest(seen_ids) AS seen(id) ON seen.id = r.alvo_id
+    WHERE seen.id IS NULL
+    GROUP BY r.alvo_id, r.alvo_categoria
+  ),
+  ranked AS (
+    SELECT
+      c.*,
+      row_number() OVER (
+        PARTITION BY c.alvo_categoria
+        ORDER BY c.total_score DESC, c.alvo_id
+      ) AS pos
+    FROM candidates c
+  )
+  SELECT
+    ranked.alvo_id,
+    ranked.alvo_categoria,
+    ranked.total_score,
+    ranked.source_count
+  FROM ranked
+  WHERE ranked.pos <= per_category
+  ORDER BY ranked.alvo_categoria, ranked.pos;
+END;
+$$;
@@ -2,6 +2,7 @@ from botocore.exceptions import ClientError
 from interface import AddItemRequest
 from datetime import datetime, timezone
 from common.dynamo_client import db_client
+from common.taste import TASTE_SK, build_taste_tx
 from loguru import logger
 import json
 
@@ -26,11 +27,6 @@ def create_item(request: AddItemRequest, sk_value: str):
         "updated_at": timestamp,
     }
 
-    if not request.rating or request.rating <= 5:
-        db_client.put_item(item)
-        return
-
-    category = request.category.lower()
     transact_items = [
         {
             "Put": {
@@ -38,6 +34,23 @@ def create_item(request: AddItemRequest, sk_value: str):
                 "Item": db_client.to_dynamo_json(item),
             }
         },
+        db_client.build_revision_tx(request.user_id),
+    ]
+    # The put replaces an item that is already in the library, so its old
+    # rating comes out of the taste vector.
+    stored = db_client.batch_get_items(request.user_id, [sk_value, TASTE_SK])
+    taste_tx = build_taste_tx(
+        request.user_id, request.id, stored.get(TASTE_SK), stored.get(sk_value), item
+    )
+
+    if not request.rating or request.rating <= 5:
+        if taste_tx:
+            transact_items.append(taste_tx)
+        db_client.execute_transaction(transact_items)
+        return
+
+    category = request.category.lower()
+    transact_items.append(
         {
             "Update": {
                 "TableName": db_client.table_name,
@@ -51,8 +64,10 @@ def create_item(request: AddItemRequest, sk_value: str):
                     {":false": False, ":true": True}
                 ),
             }
-        },
-    ]
+        }
+    )
+    if taste_tx:
+        transact_items.append(taste_tx)
 
     try:
         db_client.execute_transaction(transact_items)
@@ -60,7 +75,7 @@ def create_item(request: AddItemRequest, sk_value: str):
 
         if e.response["Error"]["Code"] == "TransactionCanceledException":
             reasons = e.response.get("CancellationReasons", [])
-            if len(reasons) > 1 and "ConditionalCheckFailed" in reasons[1].get(
+            if len(reasons) > 2 and "ConditionalCheckFailed" in reasons[2].get(
                 "Code", ""
             ):
                 raise SuperlikeExhaustedError("Superlike já gasto para esta categoria!")
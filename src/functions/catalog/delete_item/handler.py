@@ -1,11 +1,29 @@
 from common.decorators import lambda_wrapper
 from common.responses import success
 from common.dynamo_client import db_client
+from common.taste import TASTE_SK, build_taste_tx
 from interface import DeleteItemRequest
 
 
 @lambda_wrapper(model=DeleteItemRequest)
 def lambda_handler(request: DeleteItemRequest, context):
     sk_value = f"item#{request.category.lower()}#{request.id}"
-    db_client.delete_item(request.user_id, sk_value)
+    stored = db_client.batch_get_items(request.user_id, [sk_value, TASTE_SK])
+    transact_items = [
+        {
+            "Delete": {
+                "TableName": db_client.table_name,
+                "Key": db_client.to_dynamo_json(
+                    {"user_id": request.user_id, "sk": sk_value}
+                ),
+            }
+        },
+        db_client.build_revision_tx(request.user_id),
+    ]
+    taste_tx = build_taste_tx(
+        request.user_id, request.id, stored.get(TASTE_SK), stored.get(sk_value), None
+    )
+    if taste_tx:
+        transact_items.append(taste_tx)
+    db_client.execute_transaction(transact_items)
     return success({"message": "Item removido com sucesso", "deleted_id": request.id})
@@ -1,10 +1,14 @@
 from common.decorators import lambda_wrapper
 from common.responses import success
 from interface import GetLibraryRequest
-from service import fetch_library_data, enrich_and_group_items
+from service import fetch_library_data, enrich_and_group_items, get_library_version
 
 
-@lambda_wrapper(model=GetLibraryRequest)
+@lambda_wrapper(
+    model=GetLibraryRequest,
+    compress=True,
+    etag=lambda request: get_library_version(request.user_id),
+)
 def lambda_handler(request: GetLibraryRequest, context):
     prefix = f"item#{request.category.lower()}#" if request.category else "item#"
     items_data, six_star_data = fetch_library_data(
@@ -6,6 +6,12 @@ from common.supabase_funcs import get_bulk_midia_info
 from common.dynamo_client import db_client
 
 
+def get_library_version(user_id: str) -> Optional[str]:
+    """Version token for conditional GET /catalog (None disables it)."""
+    rev = db_client.get_revision(user_id)
+    return None if rev is None else f"lib-{rev}"
+
+
 def fetch_library_data(
     user_id: str, prefix: str, limit: int, next_token: Optional[str]
 ) -> Tuple[Dict, List]:
@@ -19,16 +25,15 @@ def fetch_library_data(
             sk_prefix=prefix,
             limit=limit,
             next_token=next_token,
+            replace_decimals=False,
         )
         future_6star = executor.submit(
-            db_client.query_items,
+            db_client.batch_get_items,
             user_id=user_id,
-            sk_prefix="can_6_star",
+            sks=["can_6_star"],
         )
-        future_6star_items = future_6star.result().get("items")
-        if not future_6star_items:
-            future_6star_items = [{}]
-        return future_items.result(), future_6star_items[0]
+        six_star_item = future_6star.result().get("can_6_star", {})
+        return future_items.result(), six_star_item
 
 
 def enrich_and_group_items(
@@ -41,7 +46,7 @@ def enrich_and_group_items(
         return {} if group_by_category else []
 
     ids = [it["sk"].split("#")[-1] for it in raw_items]
-    metadata_map = get_bulk_midia_info(ids)
+    metadata_map = get_bulk_midia_info(ids, view="card")
 
     if not group_by_category:
         return [
@@ -107,50 +107,50 @@ def sync_database(items, category, user_id, override=False):
     )
 
     sk_prefix = f"item#{category}#"
-    existing_response = db_client.query_items(user_id, sk_prefix)
-    next_token = existing_response.get("next_token", None)
-    while next_token:
-        more_response = db_client.query_items(user_id, sk_prefix, next_token=next_token)
-        existing_response["items"].extend(more_response.get("items", []))
-        next_token = more_response.get("next_token", None)
-
-    existing_items_map = {}
-    for db_item in existing_response.get("items", []):
-        internal_id = db_item["sk"].split("#")[-1]
-        existing_items_map[internal_id] = db_item
-
-    for item in items:
-        mal_id = str(item["mal_id"])
-        internal_id = id_map.get(mal_id)
-
-        if not internal_id:
-            logger.info(f"Skipping {item['title']} (Not found in DB)")
-            continue
-
-        sk_value = f"item#{category}#{internal_id}"
-        rating = item.get("user_score", None)
-        new_item_data = {
-            "status": item.get("user_status", "planned"),
-            "rating": rating,
-            "progress": item.get("progress", 0),
-            "review": item.get("comments", ""),
-        }
-        old_item = existing_items_map.get(str(internal_id))
-
-        if old_item:
-            if override:
-                db_client.update_item(user_id, sk_value, new_item_data)
-                old_rating = old_item.get("rating")
-                if old_rating is not None and rating is not None:
-                    old_rating = float(old_rating)
-
-                    if old_rating > 5:
-                        db_client.update_item(user_id, "can_6_star", {category: True})
-        else:
-            full_item = new_item_data | {
-                "user_id": user_id,
-                "sk": sk_value,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+    existing_items_map = {
+        db_item["sk"].split("#")[-1]: db_item
+        for db_item in db_client.iter_query(user_id, sk_prefix)
+    }
+
+    now = datetime.now(timezone.utc).isoformat()
+    restore_superlike = False
+
+    with db_client.bulk_writer(revision_user_id=user_id) as writer:
+        for item in items:
+            mal_id = str(item["mal_id"])
+            internal_id = id_map.get(mal_id)
+
+            if not internal_id:
+                logger.info(f"Skipping {item['title']} (Not found in DB)")
+                continue
+
+            sk_value = f"item#{category}#{internal_id}"
+            rating = item.get("user_score", None)
+            new_item_data = {
+                "status": item.get("user_status", "planned"),
+                "rating": rating,
+                "progress": item.get("progress", 0),
+                "review": item.get("comments", ""),
             }
-            db_client.put_item(full_item)
+            old_item = existing_items_map.get(str(internal_id))
+
+            if old_item:
+                if override:
+                    writer.put(old_item | new_item_data | {"updated_at": now})
+                    old_rating = old_item.get("rating")
+                    if old_rating is not None and rating is not None:
+                        old_rating = float(old_rating)
+
+                        if old_rating > 5:
+                            restore_superlike = True
+            else:
+                full_item = new_item_data | {
+                    "user_id": user_id,
+                    "sk": sk_value,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                writer.put(full_item)
+
+    if restore_superlike:
+        db_client.update_item(user_id, "can_6_star", {category: True})
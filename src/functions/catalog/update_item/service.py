@@ -1,16 +1,17 @@
 from datetime import datetime, timezone
 from common.dynamo_client import db_client
+from common.taste import TASTE_SK, build_taste_tx
 
 
 def update_item(user_id: str, category: str, item_id: str, update_data: dict) -> list:
     sk_value = f"item#{category.lower()}#{item_id}"
     config_sk = "can_6_star"
 
-    response = db_client.query_items(user_id, sk_value, limit=1)
-    if not response["items"]:
+    stored = db_client.batch_get_items(user_id, [sk_value, TASTE_SK])
+    old_item = stored.get(sk_value)
+    if not old_item:
         raise FileNotFoundError("Item não encontrado.")
 
-    old_item = response["items"][0]
     old_rating = float(old_item.get("rating", 0))
 
     transact_items = []
@@ -44,5 +45,11 @@ def update_item(user_id: str, category: str, item_id: str, update_data: dict) ->
                 )
             )
 
+    transact_items.append(db_client.build_revision_tx(user_id))
+    taste_tx = build_taste_tx(
+        user_id, item_id, stored.get(TASTE_SK), old_item, {**old_item, **update_data}
+    )
+    if taste_tx:
+        transact_items.append(taste_tx)
     db_client.execute_transaction(transact_items)
     return list(update_data.keys())
@@ -2,9 +2,14 @@ from common.decorators import lambda_wrapper
 from common.responses import success, not_found
 from interface import ItemRecommendationRequest
 from service import process_recommendations, MediaNotFoundError
+from utils import get_recommendation_version
 
 
-@lambda_wrapper(model=ItemRecommendationRequest)
+@lambda_wrapper(
+    model=ItemRecommendationRequest,
+    compress=True,
+    etag=lambda request: get_recommendation_version(request.user_id),
+)
 def lambda_handler(request: ItemRecommendationRequest, context):
     try:
         results = process_recommendations(
@@ -1,3 +1,4 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict, List, Any, Optional, Set
 from common.supabase_funcs import (
     get_item_recommendation,
@@ -6,6 +7,10 @@ from common.supabase_funcs import (
 )
 from utils import get_user_history, get_user_consumed_ids
 
+# A fallback started before the history arrives can't exclude consumed items
+# yet, so it asks for this many times `limit` per category.
+SPECULATIVE_FALLBACK_FACTOR = 3
+
 
 class MediaNotFoundError(Exception):
     """Raised when the source media cannot be found."""
@@ -13,6 +18,35 @@ class MediaNotFoundError(Exception):
     pass
 
 
+def _fetch_fallback_pool(
+    source_id: int, source_info: Future, consumed_ids: List[int], limit: int
+) -> List[Dict[str, Any]]:
+    media_info = source_info.result()
+    if not media_info:
+        raise MediaNotFoundError(f"Media source {source_id} not found.")
+
+    weights = {g: 10 for g in media_info.get("unified_genres", [])}
+    return get_fallback_recommendations(consumed_ids, weights, limit=limit)
+
+
+def _fill_from_fallback(
+    valid_items: List[Dict[str, Any]],
+    fallback_pool: List[Dict[str, Any]],
+    category: str,
+    limit: int,
+) -> None:
+    current_ids = {int(item["id"]) for item in valid_items}
+
+    for fb in fallback_pool:
+        if len(valid_items) >= limit:
+            break
+
+        fb_id = int(fb["id"])
+        if fb["category"] == category and fb_id not in current_ids:
+            valid_items.append(fb)
+            current_ids.add(fb_id)
+
+
 def process_recommendations(
     user_id: str,
     source_id: int,
@@ -23,43 +57,69 @@ def process_recommendations(
     """
     Orchestrates the recommendation logic: fetching history, filtering,
     and filling gaps with fallbacks.
-    """
 
-    user_history = get_user_history(user_id)
-    consumed_ids: Set[int] = set(get_user_consumed_ids(user_history))
-    consumed_ids.add(source_id)
-
-    recommendations = get_item_recommendation(
-        source_id, source_category, target_category
-    )
+    The history, the neighbour lookup and the source genres are independent
+    and fetched concurrently; the consumed-id filter runs once they are in.
+    When a neighbour list is short before filtering, the fallback RPC starts
+    right away, excluding only the source item.
+    """
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        history = pool.submit(get_user_history, user_id)
+        source_info = pool.submit(get_midia_info, source_id, view="genres")
 
-    if target_category:
-        recommendations = {target_category: recommendations.get(target_category, [])}
+        recommendations = get_item_recommendation(
+            source_id, source_category, target_category
+        )
+        if target_category:
+            recommendations = {
+                target_category: recommendations.get(target_category, [])
+            }
 
-    fallback_pool: Optional[List[Dict[str, Any]]] = None
+        fallback: Optional[Future] = None
+        speculative = any(len(items) < limit for items in recommendations.values())
+        if speculative:
+            fallback = pool.submit(
+                _fetch_fallback_pool,
+                source_id,
+                source_info,
+                [source_id],
+                limit * SPECULATIVE_FALLBACK_FACTOR,
+            )
 
-    for category, items in recommendations.items():
-        valid_items = [item for item in items if int(item["id"]) not in consumed_ids]
-        if len(valid_items) < limit:
-            if fallback_pool is None:
-                media_info = get_midia_info(source_id)
-                if not media_info:
-                    raise MediaNotFoundError(f"Media source {source_id} not found.")
+        consumed_ids: Set[int] = set(get_user_consumed_ids(history.result()))
+        consumed_ids.add(source_id)
 
-                weights = {g: 10 for g in media_info.get("unified_genres", [])}
-                fallback_pool = get_fallback_recommendations(
-                    list(consumed_ids), weights
-                )
-            current_ids = {int(item["id"]) for item in valid_items}
+        fallback_pool: Optional[List[Dict[str, Any]]] = None
 
-            for fb in fallback_pool:
-                if len(valid_items) >= limit:
-                    break
+        for category, items in recommendations.items():
+            valid_items = [
+                item for item in items if int(item["id"]) not in consumed_ids
+            ]
+            if len(valid_items) < limit:
+                if fallback is None:
+                    fallback = pool.submit(
+                        _fetch_fallback_pool,
+                        source_id,
+                        source_info,
+                        list(consumed_ids),
+                        limit,
+                    )
+                if fallback_pool is None:
+                    fallback_pool = [
+                        fb
+                        for fb in fallback.result()
+                        if int(fb["id"]) not in consumed_ids
+                    ]
+                _fill_from_fallback(valid_items, fallback_pool, category, limit)
 
-                fb_id = int(fb["id"])
-                if fb["category"] == category and fb_id not in current_ids:
-                    valid_items.append(fb)
-                    current_ids.add(fb_id)
+                if len(valid_items) < limit and speculative:
+                    # The user consumed most of the speculative pool: ask
+                    # again, this time excluding everything they've seen.
+                    speculative = False
+                    fallback_pool = _fetch_fallback_pool(
+                        source_id, source_info, list(consumed_ids), limit
+                    )
+                    _fill_from_fallback(valid_items, fallback_pool, category, limit)
 
-        recommendations[category] = valid_items[:limit]
+            recommendations[category] = valid_items[:limit]
     return recommendations
@@ -1,13 +1,18 @@
 from common.decorators import lambda_wrapper
 from common.responses import success
 from interface import UserRecommendationRequest
-from service import process_user_recommendations
+from service import get_user_recommendations
+from utils import get_recommendation_version
 
 
-@lambda_wrapper(model=UserRecommendationRequest)
+@lambda_wrapper(
+    model=UserRecommendationRequest,
+    compress=True,
+    etag=lambda request: get_recommendation_version(request.user_id),
+)
 def lambda_handler(request: UserRecommendationRequest, context):
 
-    recommendations = process_user_recommendations(
+    recommendations = get_user_recommendations(
         user_id=request.user_id, target_category=request.target_category, limit=24
     )
 
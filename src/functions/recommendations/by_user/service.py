@@ -1,40 +1,61 @@
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, List, Any, Optional, Set, Tuple
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from common.configs import CATEGORIES_AVAILABLE
+from common.dynamo_client import db_client, REVISION_SK
 from common.supabase_funcs import (
     supabase,
     get_bulk_midia_info,
     get_fallback_recommendations,
 )
 from utils import get_user_history, get_user_top_genres
+from loguru import logger
+import boto3
+import json
+import os
+
+SNAPSHOT_SK = "recs#user"
+SNAPSHOT_MAX_AGE = timedelta(hours=float(os.getenv("RECS_SNAPSHOT_MAX_AGE_HOURS", 24)))
+# Function invoked asynchronously to rebuild an expired snapshot; without it
+# expired snapshots are rebuilt inline.
+SNAPSHOT_REFRESH_FUNCTION = os.getenv("RECS_SNAPSHOT_FUNCTION")
+# Rank candidates in SQL (get_ranked_recommendations) instead of pulling every
+# neighbour row through get_batch_recommendations.
+SERVER_SIDE_RANKING = os.getenv("RECS_SERVER_SIDE_RANKING", "0") == "1"
+
+Ranked = Dict[str, List[Tuple[Dict[str, Any], float]]]
 
 
 def process_user_recommendations(
     user_id: str, target_category: Optional[str] = None, limit: int = 24
 ) -> Dict[str, List[Dict[str, Any]]]:
-    user_history = get_user_history(user_id)
+    ranked = compute_user_recommendations(user_id, target_category, limit)
+    return {cat: [item for item, _ in items] for cat, items in ranked.items()}
 
-    seen_keys: Set[str] = set()
-    seen_ids_only: Set[int] = set()
-    source_ids: List[str] = []
-    source_types: List[str] = []
 
-    for item in user_history:
-        parts = item["sk"].split("#")
-        i_id = parts[-1]
-        i_type = parts[-2]
+def _fetch_fallback_pool(
+    user_id: str,
+    user_history: List[Dict[str, Any]],
+    rev: Optional[int],
+    seen_ids: Set[int],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    top_genres = get_user_top_genres(user_id, user_history, rev)
+    return get_fallback_recommendations(list(seen_ids), top_genres, limit=limit)
 
-        seen_keys.add(f"{i_type}_{i_id}")
-        seen_ids_only.add(int(i_id))
-
-        rating = float(item.get("rating", 0) or 0)
-        if rating >= 4.0:
-            source_ids.append(i_id)
-            source_types.append(i_type)
-
-    if not source_ids:
-        return {}
 
+def _rank_candidates(
+    source_ids: List[str],
+    source_types: List[str],
+    seen_keys: Set[str],
+    per_category: int,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Pulls every neighbour row of the source items and aggregates them here:
+    summed score and source count per unseen candidate, best `per_category`
+    per category.
+    """
     rpc_response = supabase.rpc(
         "get_batch_recommendations",
         {"source_ids": source_ids, "source_types": source_types},
@@ -63,20 +84,107 @@ def process_user_recommendations(
         if cat in grouped_recs:
             grouped_recs[cat].append(item)
 
-    if target_category:
-        grouped_recs = {target_category: grouped_recs.get(target_category, [])}
+    for category_candidates in grouped_recs.values():
+        category_candidates.sort(key=lambda x: x["score"], reverse=True)
+        del category_candidates[per_category:]
+    return grouped_recs
 
-    fallback_pool = None
 
-    for cat in grouped_recs:
+def _rank_candidates_server_side(
+    source_ids: List[str],
+    source_types: List[str],
+    seen_ids: Set[int],
+    per_category: int,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Same result as _rank_candidates, with the filtering, aggregation and
+    per-category cut done by the get_ranked_recommendations RPC.
+    """
+    rpc_response = supabase.rpc(
+        "get_ranked_recommendations",
+        {
+            "source_ids": source_ids,
+            "source_types": source_types,
+            "seen_ids": list(seen_ids),
+            "per_category": per_category,
+        },
+    ).execute()
+
+    grouped_recs: Dict[str, List[Dict]] = {c: [] for c in CATEGORIES_AVAILABLE}
+    for rec in rpc_response.data:
+        cat = rec["alvo_categoria"]
+        if cat in grouped_recs:
+            grouped_recs[cat].append(
+                {
+                    "score": rec["score"],
+                    "sources": rec["sources"],
+                    "id": str(rec["alvo_id"]),
+                    "cat": cat,
+                }
+            )
+    return grouped_recs
 
-        category_candidates = grouped_recs[cat]
-        category_candidates.sort(key=lambda x: x["score"], reverse=True)
-        top_candidates = category_candidates[: int(limit * 1.5)]
 
-        candidate_ids = [c["id"] for c in top_candidates]
+def compute_user_recommendations(
+    user_id: str,
+    target_category: Optional[str] = None,
+    limit: int = 24,
+    rev: Optional[int] = None,
+) -> Ranked:
+    """
+    Full computation. Returns, per category, (item, score) pairs in rank order.
+    `rev` is the library revision read before the call, if any.
+    """
+    user_history = get_user_history(user_id)
+
+    seen_keys: Set[str] = set()
+    seen_ids_only: Set[int] = set()
+    source_ids: List[str] = []
+    source_types: List[str] = []
 
-        metadata_map = get_bulk_midia_info(candidate_ids)
+    for item in user_history:
+        parts = item["sk"].split("#")
+        i_id = parts[-1]
+        i_type = parts[-2]
+
+        seen_keys.add(f"{i_type}_{i_id}")
+        seen_ids_only.add(int(i_id))
+
+        rating = float(item.get("rating", 0) or 0)
+        if rating >= 4.0:
+            source_ids.append(i_id)
+            source_types.append(i_type)
+
+    if not source_ids:
+        return {}
+
+    per_category = int(limit * 1.5)
+    if SERVER_SIDE_RANKING:
+        top_by_cat = _rank_candidates_server_side(
+            source_ids, source_types, seen_ids_only, per_category
+        )
+    else:
+        top_by_cat = _rank_candidates(source_ids, source_types, seen_keys, per_category)
+
+    if target_category:
+        top_by_cat = {target_category: top_by_cat.get(target_category, [])}
+
+    # Gather: every candidate that can make it into any category, hydrated
+    # in one fetch. A category that is already short will need the fallback,
+    # which only depends on the history and stored taste, so it runs alongside.
+    ids_to_fetch = {c["id"] for cands in top_by_cat.values() for c in cands}
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        fallback = None
+        if any(len(cands) < limit for cands in top_by_cat.values()):
+            fallback = pool.submit(
+                _fetch_fallback_pool, user_id, user_history, rev, seen_ids_only, limit
+            )
+        metadata_map = get_bulk_midia_info(list(ids_to_fetch), view="recommendation")
+        fallback_pool = fallback.result() if fallback else None
+
+    # Rank: in memory, unless hydration left a category short unexpectedly.
+    grouped_recs: Ranked = {}
+    for cat, top_candidates in top_by_cat.items():
         final_items = []
         current_ids_in_batch = set()
 
@@ -85,7 +193,7 @@ def process_user_recommendations(
             info = metadata_map.get(str(c_id))
 
             if info:
-                final_items.append(info)
+                final_items.append((info, cand["score"]))
                 current_ids_in_batch.add(int(c_id))
 
             if len(final_items) >= limit:
@@ -93,9 +201,8 @@ def process_user_recommendations(
 
         if len(final_items) < limit:
             if fallback_pool is None:
-                _, top_genres_list = get_user_top_genres(user_history)
-                fallback_pool = get_fallback_recommendations(
-                    list(seen_ids_only), top_genres_list, limit=limit
+                fallback_pool = _fetch_fallback_pool(
+                    user_id, user_history, rev, seen_ids_only, limit
                 )
 
             for fb in fallback_pool:
@@ -108,9 +215,116 @@ def process_user_recommendations(
                     and (fb_id not in seen_ids_only)
                     and (fb_id not in current_ids_in_batch)
                 ):
-                    final_items.append(fb)
+                    final_items.append((fb, 0.0))
                     current_ids_in_batch.add(fb_id)
 
         grouped_recs[cat] = final_items
 
     return grouped_recs
+
+
+def _is_current(snapshot: Optional[dict], rev: Optional[int], limit: int) -> bool:
+    return (
+        bool(snapshot)
+        and snapshot.get("rev") == rev
+        and int(snapshot.get("limit") or 0) >= limit
+    )
+
+
+def _is_expired(snapshot: dict) -> bool:
+    try:
+        built_at = datetime.fromisoformat(snapshot["built_at"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return datetime.now(timezone.utc) - built_at >= SNAPSHOT_MAX_AGE
+
+
+def _hydrate_snapshot(
+    snapshot: dict, target_category: Optional[str], limit: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    entries = snapshot.get("recs") or {}
+    if not entries:
+        return {}
+    if target_category:
+        entries = {target_category: entries.get(target_category, [])}
+
+    ids = [entry["id"] for items in entries.values() for entry in items[:limit]]
+    metadata_map = get_bulk_midia_info(ids, view="recommendation")
+    return {
+        cat: [
+            metadata_map[entry["id"]]
+            for entry in items[:limit]
+            if entry["id"] in metadata_map
+        ]
+        for cat, items in entries.items()
+    }
+
+
+def save_snapshot(user_id: str, rev: Optional[int], ranked: Ranked, limit: int):
+    """
+    Stores the snapshot unless the library moved past `rev` meanwhile, so a
+    slow computation can't replace one already built for a newer revision.
+    """
+    db_client.put_item_at_revision(
+        {
+            "user_id": user_id,
+            "sk": SNAPSHOT_SK,
+            "rev": rev,
+            "limit": limit,
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "recs": {
+                cat: [{"id": str(item["id"]), "score": score} for item, score in items]
+                for cat, items in ranked.items()
+            },
+        },
+        rev,
+    )
+
+
+def refresh_snapshot(user_id: str, limit: int = 24) -> Ranked:
+    """Recomputes and stores the user's snapshot, tagged with the current revision."""
+    rev = db_client.get_revision(user_id)
+    ranked = compute_user_recommendations(user_id, None, limit, rev)
+    save_snapshot(user_id, rev, ranked, limit)
+    return ranked
+
+
+def request_refresh(user_id: str) -> bool:
+    """Starts snapshot_handler for the user without waiting for it."""
+    if not SNAPSHOT_REFRESH_FUNCTION:
+        return False
+    try:
+        boto3.client("lambda").invoke(
+            FunctionName=SNAPSHOT_REFRESH_FUNCTION,
+            InvocationType="Event",
+            Payload=json.dumps({"user_ids": [user_id]}),
+        )
+    except Exception:
+        logger.exception(f"Failed to request a snapshot refresh for {user_id}")
+        return False
+    return True
+
+
+def get_user_recommendations(
+    user_id: str, target_category: Optional[str] = None, limit: int = 24
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Serves the materialized snapshot when it matches the current library
+    revision. One past SNAPSHOT_MAX_AGE is still served while a refresh runs
+    in the background; otherwise recomputes all categories and stores a new
+    snapshot.
+    """
+    stored = db_client.batch_get_items(user_id, [REVISION_SK, SNAPSHOT_SK])
+    rev = stored.get(REVISION_SK, {}).get("rev")
+    snapshot = stored.get(SNAPSHOT_SK)
+
+    if _is_current(snapshot, rev, limit):
+        if not _is_expired(snapshot) or request_refresh(user_id):
+            return _hydrate_snapshot(snapshot, target_category, limit)
+
+    ranked = compute_user_recommendations(user_id, None, limit, rev)
+    save_snapshot(user_id, rev, ranked, limit)
+
+    if target_category and ranked:
+        ranked = {target_category: ranked.get(target_category, [])}
+    return {cat: [item for item, _ in items] for cat, items in ranked.items()}
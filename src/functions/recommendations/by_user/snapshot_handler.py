@@ -0,0 +1,26 @@
+from service import refresh_snapshot
+from loguru import logger
+
+
+def lambda_handler(event, context):
+    """
+    Triggered by the DynamoDB stream whenever a user's meta#rev changes, and
+    invoked asynchronously with {"user_ids": [...]} for expired snapshots.
+    Bursts (e.g. sync flushes) are collapsed to one refresh per user.
+    """
+    user_ids = {
+        record["dynamodb"]["Keys"]["user_id"]["S"]
+        for record in event.get("Records", [])
+        if record.get("dynamodb", {}).get("Keys", {}).get("user_id")
+    }
+    user_ids.update(str(user_id) for user_id in event.get("user_ids", []))
+
+    failed = 0
+    for user_id in user_ids:
+        try:
+            refresh_snapshot(user_id)
+        except Exception:
+            failed += 1
+            logger.exception(f"Failed to refresh recommendations for {user_id}")
+
+    return {"refreshed": len(user_ids) - failed, "failed": failed}
@@ -4,7 +4,7 @@ from common.responses import success
 from interface import SearchRequest
 
 
-@lambda_wrapper(model=SearchRequest)
+@lambda_wrapper(model=SearchRequest, compress=True)
 def lambda_handler(request: SearchRequest, context):
     resultados, _ = search_midia(request.q, request.year, request.category)
     return success(resultados)
@@ -2,7 +2,9 @@ from typing import Any, Callable, Dict, Optional, Type, TypeVar, Union, TypedDic
 from pydantic import BaseModel, ValidationError, Field
 from common.responses import (
     bad_request,
+    compress_response,
     internal_error,
+    not_modified,
     unauthorized,
     unprocessable_entity,
 )
@@ -75,9 +77,34 @@ def _merge_request_data(event: JsonDict, body: Dict, auth_data: Dict) -> Dict[st
     return {**qs, **path, **body, **auth_data}
 
 
+def _get_header(event: JsonDict, name: str) -> Optional[str]:
+    """Case-insensitive header lookup (HTTP API lowercases, REST API doesn't)."""
+    headers = event.get("headers") or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
 def lambda_wrapper(
     model: Type[T],
     require_auth: bool = True,
+    compress: bool = False,
+    etag: Optional[Callable[[T], Optional[str]]] = None,
 ) -> Callable[[Callable[[T, Any], Any]], Callable[..., Any]]:
     """
     Decorator that hydrates a Pydantic model from the AWS Lambda event.
@@ -85,6 +112,12 @@ def lambda_wrapper(
     Args:
         model: The Pydantic class to validate against.
         require_auth: If True, blocks requests without a valid token.
+        compress: If True, large responses are compressed (br/gzip) according
+            to the request's Accept-Encoding header.
+        etag: Optional callable returning a cheap version token for the
+            request. When the client's If-None-Match matches it, a 304 is
+            returned without calling the handler. Returning None disables
+            conditional handling for that request.
     """
 
     def decorator(func: Callable[[T, Any], Any]) -> Callable[..., Any]:
@@ -110,7 +143,33 @@ def lambda_wrapper(
                     logger.warning(f"Validation failed: {e.errors()}")
                     return unprocessable_entity(error=e.json())
 
-                return func(request_model, context)
+                tag = None
+                if etag:
+                    version = etag(request_model)
+                    if version is not None:
+                        tag = f'W/"{version}"'
+                        if _etag_matches(_get_header(event, "if-none-match"), tag):
+                            return not_modified(tag)
+
+                response = func(request_model, context)
+                if (
+                    tag
+                    and isinstance(response, dict)
+                    and 200 <= response.get("statusCode", 0) < 300
+                ):
+                    response = {
+                        **response,
+                        "headers": {
+                            **(response.get("headers") or {}),
+                            "ETag": tag,
+                            "Cache-Control": "private, no-cache",
+                        },
+                    }
+                if compress and isinstance(response, dict):
+                    response = compress_response(
+                        response, _get_header(event, "accept-encoding")
+                    )
+                return response
 
             except Exception as e:
                 logger.exception("Unhandled exception in lambda_wrapper")
@@ -1,19 +1,39 @@
 import os
 import json
+import time
+import queue
 import base64
+import threading
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
 from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Dict, Iterator, List, Optional
 from decimal import Decimal
 from loguru import logger
 
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+BATCH_MAX_WORKERS = 8
+BATCH_MAX_ATTEMPTS = 6
+BATCH_BACKOFF_BASE = 0.05
+BATCH_BACKOFF_MAX = 2.0
+
+# Per-user library revision, bumped on every library mutation.
+REVISION_SK = "meta#rev"
+
+
+class BatchOperationError(Exception):
+    """Raised when DynamoDB keeps returning unprocessed keys/items after all retries."""
+
+    pass
+
 
 class DynamoClient:
-    def __init__(self):
-        self.table_name = os.environ.get("TABLE_NAME", "TabelaDados")
+    def __init__(self, table_name: Optional[str] = None):
+        self.table_name = table_name or os.environ.get("TABLE_NAME", "TabelaDados")
 
         self.resource = boto3.resource("dynamodb")
         self.client = boto3.client("dynamodb")
@@ -60,6 +80,59 @@ class DynamoClient:
             logger.warning("Failed to decode pagination token.")
             return None
 
+    def _from_dynamo_json(self, item: dict) -> dict:
+        """Converts DynamoDB JSON back to a plain dict (Decimals included)."""
+        return {k: self.deserializer.deserialize(v) for k, v in item.items()}
+
+    def _chunks(self, lst: list, size: int):
+        for i in range(0, len(lst), size):
+            yield lst[i : i + size]
+
+    def _run_batch_with_retry(
+        self, operation, request_items: dict, unprocessed_field: str
+    ) -> List[dict]:
+        """
+        Calls a Batch* operation until DynamoDB stops returning unprocessed entries,
+        sleeping with exponential backoff between attempts.
+        """
+        responses = []
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            response = operation(RequestItems=request_items)
+            responses.append(response)
+
+            request_items = response.get(unprocessed_field) or {}
+            if not request_items:
+                return responses
+
+            time.sleep(min(BATCH_BACKOFF_BASE * (2**attempt), BATCH_BACKOFF_MAX))
+
+        pending = sum(
+            len(v["Keys"]) if isinstance(v, dict) else len(v)
+            for v in request_items.values()
+        )
+        logger.error(f"{unprocessed_field} left after retries: {pending}")
+        raise BatchOperationError(f"{pending} entries left in {unprocessed_field}")
+
+    def _batch_get_chunk(
+        self, keys: List[dict], projection: Optional[List[str]] = None
+    ) -> List[dict]:
+        responses = self._run_batch_with_retry(
+            self.client.batch_get_item,
+            {self.table_name: {"Keys": keys, **self._projection_kwargs(projection)}},
+            "UnprocessedKeys",
+        )
+        items = []
+        for response in responses:
+            items.extend(response.get("Responses", {}).get(self.table_name, []))
+        return items
+
+    def _batch_write_chunk(self, write_requests: List[dict]) -> None:
+        self._run_batch_with_retry(
+            self.client.batch_write_item,
+            {self.table_name: write_requests},
+            "UnprocessedItems",
+        )
+
     def to_dynamo_json(self, data: dict) -> dict:
         """Converts standard Dict to DynamoDB JSON format ({"S": "val"} etc)."""
         clean_data = self._sanitize_float(data)
@@ -74,13 +147,167 @@ class DynamoClient:
             logger.error(f"Error putting item: {e.response['Error']['Message']}")
             raise
 
-    def query_items(self, user_id, sk_prefix=None, limit=1000, next_token=None):
-        try:
-            key_condition = Key("user_id").eq(str(user_id))
-            if sk_prefix:
-                key_condition &= Key("sk").begins_with(str(sk_prefix))
+    def _key_condition(self, user_id, sk_prefix=None):
+        key_condition = Key("user_id").eq(str(user_id))
+        if sk_prefix:
+            key_condition &= Key("sk").begins_with(str(sk_prefix))
+        return key_condition
+
+    def _projection_kwargs(self, projection: Optional[List[str]]) -> dict:
+        """
+        Builds ProjectionExpression kwargs, escaping every attribute through
+        ExpressionAttributeNames so reserved words (status, count...) are safe.
+        """
+        if not projection:
+            return {}
+        attr_names = {
+            f"#p{i}": attr for i, attr in enumerate(dict.fromkeys(projection))
+        }
+        return {
+            "ProjectionExpression": ", ".join(attr_names),
+            "ExpressionAttributeNames": attr_names,
+        }
 
-            query_kwargs = {"KeyConditionExpression": key_condition, "Limit": limit}
+    def _query_pages(
+        self, user_id, sk_prefix=None, page_size=1000, projection=None
+    ) -> Iterator[list]:
+        """Yields every page of a query, following LastEvaluatedKey directly."""
+        query_kwargs = {
+            "KeyConditionExpression": self._key_condition(user_id, sk_prefix),
+            "Limit": page_size,
+            **self._projection_kwargs(projection),
+        }
+        while True:
+            try:
+                response = self.table.query(**query_kwargs)
+            except ClientError as e:
+                logger.error(f"Error querying items: {e.response['Error']['Message']}")
+                raise
+
+            yield self._replace_decimals(response.get("Items", []))
+
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                return
+            query_kwargs["ExclusiveStartKey"] = last_key
+
+    def _iter_query_fanout(
+        self, user_id, prefixes, page_size, projection=None
+    ) -> Iterator[dict]:
+        """
+        Queries each prefix in its own thread and yields items as pages arrive.
+        At most two pages per prefix are buffered at any time.
+        """
+        pages = queue.Queue(maxsize=len(prefixes) * 2)
+        stop = threading.Event()
+        done = object()
+
+        def produce(prefix):
+            try:
+                for page in self._query_pages(user_id, prefix, page_size, projection):
+                    if stop.is_set():
+                        break
+                    pages.put(page)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(done)
+
+        executor = ThreadPoolExecutor(max_workers=len(prefixes))
+        for prefix in prefixes:
+            executor.submit(produce, prefix)
+
+        remaining = len(prefixes)
+        try:
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            stop.set()
+            while remaining:
+                if pages.get() is done:
+                    remaining -= 1
+            executor.shutdown(wait=True)
+
+    def iter_query(
+        self, user_id, sk_prefix=None, page_size=1000, projection=None, categories=None
+    ) -> Iterator[dict]:
+        """
+        Streams every item matching the prefix across all pages.
+
+        projection limits the attributes returned (e.g. ["sk", "rating"]).
+
+        If categories is given, the query is split into one
+        `{sk_prefix}{category}#` prefix per category, queried concurrently.
+        Items are then yielded in arrival order rather than SK order.
+        """
+        if categories:
+            prefixes = [f"{sk_prefix or ''}{cat}#" for cat in categories]
+            yield from self._iter_query_fanout(user_id, prefixes, page_size, projection)
+            return
+
+        for page in self._query_pages(user_id, sk_prefix, page_size, projection):
+            yield from page
+
+    def iter_scan_segment(
+        self,
+        segment: int,
+        total_segments: int,
+        sk_prefix=None,
+        projection=None,
+        page_size=1000,
+    ) -> Iterator[dict]:
+        """
+        Streams one segment of a parallel Scan over the whole table. Run the
+        segments 0..total_segments-1 concurrently to cover every partition.
+        """
+        scan_kwargs = {
+            "Segment": segment,
+            "TotalSegments": total_segments,
+            "Limit": page_size,
+            **self._projection_kwargs(projection),
+        }
+        if sk_prefix:
+            scan_kwargs["FilterExpression"] = Attr("sk").begins_with(str(sk_prefix))
+
+        while True:
+            try:
+                response = self.table.scan(**scan_kwargs)
+            except ClientError as e:
+                logger.error(f"Error scanning table: {e.response['Error']['Message']}")
+                raise
+
+            yield from self._replace_decimals(response.get("Items", []))
+
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                return
+            scan_kwargs["ExclusiveStartKey"] = last_key
+
+    def query_items(
+        self,
+        user_id,
+        sk_prefix=None,
+        limit=1000,
+        next_token=None,
+        projection=None,
+        replace_decimals=True,
+    ):
+        """
+        Queries a single page. Pass replace_decimals=False when the items go
+        straight into an API response: common.responses encodes Decimals itself.
+        """
+        try:
+            query_kwargs = {
+                "KeyConditionExpression": self._key_condition(user_id, sk_prefix),
+                "Limit": limit,
+                **self._projection_kwargs(projection),
+            }
 
             if next_token:
                 start_key = self._decode_token(next_token)
@@ -90,7 +317,11 @@ class DynamoClient:
             response = self.table.query(**query_kwargs)
 
             return {
-                "items": self._replace_decimals(response.get("Items", [])),
+                "items": (
+                    self._replace_decimals(response.get("Items", []))
+                    if replace_decimals
+                    else response.get("Items", [])
+                ),
                 "next_token": self._encode_token(response.get("LastEvaluatedKey")),
                 "count": response["Count"],
             }
@@ -98,6 +329,188 @@ class DynamoClient:
             logger.error(f"Error querying items: {e.response['Error']['Message']}")
             raise
 
+    def batch_get_items(
+        self, user_id, sks: List[str], projection: Optional[List[str]] = None
+    ) -> Dict[str, dict]:
+        """
+        Fetches several items of a user by exact SK using BatchGetItem.
+
+        Keys are split in chunks of 100 that run concurrently. Missing items are
+        simply absent from the returned dict, which is keyed by SK.
+        """
+        unique_sks = list(dict.fromkeys(str(sk) for sk in sks if sk))
+        if not unique_sks:
+            return {}
+        if projection:
+            projection = ["sk", *projection]
+
+        keys = [
+            self.to_dynamo_json({"user_id": str(user_id), "sk": sk})
+            for sk in unique_sks
+        ]
+        chunks = list(self._chunks(keys, BATCH_GET_SIZE))
+
+        try:
+            if len(chunks) == 1:
+                raw_items = self._batch_get_chunk(chunks[0], projection)
+            else:
+                workers = min(BATCH_MAX_WORKERS, len(chunks))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    raw_items = [
+                        item
+                        for chunk_items in executor.map(
+                            lambda chunk: self._batch_get_chunk(chunk, projection),
+                            chunks,
+                        )
+                        for item in chunk_items
+                    ]
+        except ClientError as e:
+            logger.error(f"Error batch getting items: {e.response['Error']['Message']}")
+            raise
+
+        items = self._replace_decimals([self._from_dynamo_json(i) for i in raw_items])
+        return {item["sk"]: item for item in items}
+
+    def batch_write_items(
+        self, puts: Optional[List[dict]] = None, deletes: Optional[List[dict]] = None
+    ) -> int:
+        """
+        Writes puts and deletes (keys with user_id/sk) through BatchWriteItem.
+
+        Requests are split in chunks of 25 that are flushed concurrently and
+        UnprocessedItems are retried. Returns the number of requests written.
+        """
+        # to_dynamo_json already turns floats into Decimals.
+        write_requests = [
+            {"PutRequest": {"Item": self.to_dynamo_json(item)}} for item in puts or []
+        ]
+        write_requests += [
+            {
+                "DeleteRequest": {
+                    "Key": self.to_dynamo_json(
+                        {"user_id": str(key["user_id"]), "sk": str(key["sk"])}
+                    )
+                }
+            }
+            for key in deletes or []
+        ]
+        if not write_requests:
+            return 0
+
+        chunks = list(self._chunks(write_requests, BATCH_WRITE_SIZE))
+        try:
+            if len(chunks) == 1:
+                self._batch_write_chunk(chunks[0])
+            else:
+                workers = min(BATCH_MAX_WORKERS, len(chunks))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(self._batch_write_chunk, chunks))
+        except ClientError as e:
+            logger.error(f"Error batch writing items: {e.response['Error']['Message']}")
+            raise
+
+        return len(write_requests)
+
+    def bulk_writer(
+        self,
+        flush_size: int = BATCH_WRITE_SIZE * BATCH_MAX_WORKERS,
+        revision_user_id: Optional[str] = None,
+    ):
+        """
+        Returns a buffered BulkWriter bound to this client. With
+        revision_user_id, the user's library revision is bumped after each flush.
+        """
+        return BulkWriter(
+            self, flush_size=flush_size, revision_user_id=revision_user_id
+        )
+
+    def build_revision_tx(self, user_id) -> dict:
+        """Transaction entry that atomically increments the user's library revision."""
+        return {
+            "Update": {
+                "TableName": self.table_name,
+                "Key": self.to_dynamo_json(
+                    {"user_id": str(user_id), "sk": REVISION_SK}
+                ),
+                "UpdateExpression": "SET #updated_at = :now ADD #rev :one",
+                "ExpressionAttributeNames": {
+                    "#rev": "rev",
+                    "#updated_at": "updated_at",
+                },
+                "ExpressionAttributeValues": self.to_dynamo_json(
+                    {":one": 1, ":now": datetime.now(timezone.utc).isoformat()}
+                ),
+            }
+        }
+
+    def bump_revision(self, user_id) -> None:
+        """Increments the user's library revision outside of a transaction."""
+        try:
+            self.table.update_item(
+                Key={"user_id": str(user_id), "sk": REVISION_SK},
+                UpdateExpression="SET #updated_at = :now ADD #rev :one",
+                ExpressionAttributeNames={"#rev": "rev", "#updated_at": "updated_at"},
+                ExpressionAttributeValues={
+                    ":one": 1,
+                    ":now": datetime.now(timezone.utc).isoformat(),
+                },
+            )
+        except ClientError as e:
+            logger.error(f"Error bumping revision: {e.response['Error']['Message']}")
+            raise
+
+    def get_revision(self, user_id) -> Optional[int]:
+        """Returns the user's library revision, or None if it was never written."""
+        item = self.batch_get_items(user_id, [REVISION_SK], projection=["rev"])
+        rev = item.get(REVISION_SK, {}).get("rev")
+        return None if rev is None else int(rev)
+
+    def put_item_at_revision(self, item: dict, rev: Optional[int]) -> bool:
+        """
+        Puts an item derived from the library at revision `rev` (None if the
+        revision was never written). Returns False, writing nothing, if the
+        library has moved on since.
+        """
+        if rev is None:
+            condition = "attribute_not_exists(#rev)"
+            values = None
+        else:
+            condition = "#rev = :rev"
+            values = self.to_dynamo_json({":rev": rev})
+
+        check = {
+            "TableName": self.table_name,
+            "Key": self.to_dynamo_json(
+                {"user_id": str(item["user_id"]), "sk": REVISION_SK}
+            ),
+            "ConditionExpression": condition,
+            "ExpressionAttributeNames": {"#rev": "rev"},
+        }
+        if values:
+            check["ExpressionAttributeValues"] = values
+
+        try:
+            self.client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Put": {
+                            "TableName": self.table_name,
+                            "Item": self.to_dynamo_json(item),
+                        }
+                    },
+                    {"ConditionCheck": check},
+                ]
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "TransactionCanceledException":
+                logger.info(
+                    f"Revision of {item['user_id']} moved, {item['sk']} not saved"
+                )
+                return False
+            logger.error(f"Error putting item: {e.response['Error']['Message']}")
+            raise
+
     def delete_item(self, user_id, sk) -> bool:
         try:
             self.table.delete_item(Key={"user_id": user_id, "sk": sk})
@@ -188,4 +601,66 @@ class DynamoClient:
         return tx_item
 
 
+class BulkWriter:
+    """
+    Buffers puts/deletes and flushes them through DynamoClient.batch_write_items.
+
+    Writes to the same key are collapsed (last one wins), since BatchWriteItem
+    rejects duplicated keys in a request. Use as a context manager so the
+    remaining buffer is flushed on exit.
+
+    BatchWriteItem can't carry an ADD, so when revision_user_id is set the
+    revision is bumped after each flush, including one that raised partway.
+    Readers may briefly see new items under the old revision, but never old
+    items under a new one.
+    """
+
+    def __init__(
+        self,
+        client: DynamoClient,
+        flush_size: int,
+        revision_user_id: Optional[str] = None,
+    ):
+        self.client = client
+        self.flush_size = max(flush_size, BATCH_WRITE_SIZE)
+        self.revision_user_id = revision_user_id
+        self._pending: Dict[tuple, tuple] = {}
+        self.written = 0
+
+    def put(self, item: dict) -> None:
+        self._add((str(item["user_id"]), str(item["sk"])), ("put", item))
+
+    def delete(self, user_id, sk) -> None:
+        self._add((str(user_id), str(sk)), ("delete", {"user_id": user_id, "sk": sk}))
+
+    def _add(self, key: tuple, request: tuple) -> None:
+        self._pending.pop(key, None)
+        self._pending[key] = request
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self) -> int:
+        if not self._pending:
+            return 0
+        requests, self._pending = list(self._pending.values()), {}
+        puts = [payload for kind, payload in requests if kind == "put"]
+        deletes = [payload for kind, payload in requests if kind == "delete"]
+        try:
+            written = self.client.batch_write_items(puts=puts, deletes=deletes)
+        finally:
+            # Part of the batch may have landed before a failure or timeout.
+            if self.revision_user_id:
+                self.client.bump_revision(self.revision_user_id)
+        self.written += written
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+
 db_client = DynamoClient()
@@ -0,0 +1,21 @@
+# Unified genres, as mapped by ETL/generos/unify_*.sql. Stored taste vectors
+# (common.taste) index into this tuple: append new genres at the end and never
+# reorder, since the vector length is what tells a stale vector apart.
+GENRE_VOCABULARY = (
+    "Ação",
+    "Aventura",
+    "Drama",
+    "Fantasia",
+    "Terror / Suspense",
+    "Ficção Científica",
+    "Realidade / Educação",
+    "Romance",
+    "Comédia",
+    "Estratégia / Raciocínio",
+    "Esportes / Competitivo",
+    "Adulto",
+    "Infantil / Família",
+    "Música",
+)
+
+GENRE_INDEX = {genre: i for i, genre in enumerate(GENRE_VOCABULARY)}
@@ -0,0 +1,235 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import functools
+import os, ast, json
+
+
+@functools.lru_cache(maxsize=4096)
+def _join_stringified_str(v: str) -> str:
+    v = v.strip()  # Remove espaços extras
+    try:
+        parsed = ast.literal_eval(v)
+        return ",".join(parsed) if isinstance(parsed, list) else ",".join([parsed])
+    except (ValueError, SyntaxError):
+        return ",".join([v])
+
+
+def _join_stringified_list(v):
+    if v is None:
+        return ""
+    if isinstance(v, list):
+        return ",".join(v)
+    if isinstance(v, str):
+        return _join_stringified_str(v)
+    return v
+
+
+class MetadataItem(BaseModel):
+    # Books
+    author: Optional[str] = Field(None, alias="autor")
+    pages: Optional[int] = Field(None, alias="paginas")
+    editor: Optional[str] = Field(None, alias="editora")
+
+    # Movies
+    duration: Optional[str] = Field(None, alias="duracao")
+    director: Optional[str] = Field(None, alias="diretor")
+    star: Optional[str] = Field(None, alias="star")
+
+    # Games
+    platform: Optional[str] = Field("", alias="plataformas")
+    developers: Optional[str] = Field("", alias="desenvolvedores")
+
+    # anime
+    episodes: Optional[int] = Field(0, alias="episodios")
+    mal_id: Optional[str | int] = Field("", alias="id_original")
+
+    # manga
+    type: Optional[str] = Field(None, alias="type")
+    status: Optional[str] = Field(None, alias="status")
+    volumes: Optional[int] = Field(None, alias="volumes")
+    chapters: Optional[int] = Field(None, alias="chapters")
+    authors: Optional[list[str]] = Field([], alias="authors")
+    serializations: Optional[list[str]] = Field([], alias="serializations")
+    mal_id_manga: Optional[str | int] = Field("", alias="mal_id")
+
+    # serie
+    mean_runtime: Optional[int] = Field(0, alias="duracao_media")
+    creators: Optional[str] = Field("", alias="criadores")
+    main_cast: Optional[str] = Field("", alias="elenco_principal")
+    total_seasons: Optional[int] = Field(0, alias="total_temporadas")
+
+    @field_validator("platform", "developers", mode="before")
+    @classmethod
+    def parse_stringified_list(cls, v):
+        return _join_stringified_list(v)
+
+
+class ListItemsItem(BaseModel):
+    id: str = Field(..., alias="id")
+    title: str = Field(..., alias="titulo")
+    category: str = Field(..., alias="categoria")
+    genres: list[str] = Field([], alias="generos")
+    unified_genres: list[str] = Field([], alias="generos_unificados")
+    metadata: MetadataItem = Field(MetadataItem(), alias="metadata")
+    cover_url: Optional[str] = Field("", alias="imagem")
+    release_year: Optional[int] = Field(None, alias="ano_lancamento")
+    description: Optional[str] = Field("", alias="descricao")
+    age_rating: Optional[int] = Field(None, alias="classificacao")
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def parse_stringified_list(cls, v):
+        return "" if v is None else str(v)
+
+    @field_validator("metadata", mode="before")
+    @classmethod
+    def parse_metadata(cls, v):
+        if isinstance(v, str):
+            try:
+                v_dict = json.loads(v)
+                return v_dict
+            except json.JSONDecodeError:
+                return v
+        return v
+
+
+def json_encode_item(item: ListItemsItem) -> dict:
+    encoded = item.model_dump()
+    encoded["metadata"] = {}
+    if item.category == "livro":
+        encoded["metadata"]["author"] = item.metadata.author
+        encoded["metadata"]["pages"] = item.metadata.pages
+        encoded["metadata"]["editor"] = item.metadata.editor
+
+    elif item.category == "filme":
+        encoded["metadata"]["duration"] = item.metadata.duration
+        encoded["metadata"]["director"] = item.metadata.director
+        encoded["metadata"]["star"] = item.metadata.star
+
+    elif item.category == "jogo":
+        encoded["metadata"]["platform"] = item.metadata.platform
+        encoded["metadata"]["developers"] = item.metadata.developers
+
+    elif item.category == "anime":
+        encoded["metadata"]["episodes"] = item.metadata.episodes
+        encoded["metadata"]["mal_id"] = item.metadata.mal_id
+
+    elif item.category == "manga":
+        encoded["metadata"]["type"] = item.metadata.type
+        encoded["metadata"]["status"] = item.metadata.status
+        encoded["metadata"]["volumes"] = item.metadata.volumes
+        encoded["metadata"]["chapters"] = item.metadata.chapters
+        encoded["metadata"]["authors"] = item.metadata.authors
+        encoded["metadata"]["serializations"] = item.metadata.serializations
+        encoded["metadata"]["mal_id"] = item.metadata.mal_id_manga
+
+    elif item.category == "serie":
+        encoded["metadata"]["mean_runtime"] = item.metadata.mean_runtime
+        encoded["metadata"]["creators"] = item.metadata.creators
+        encoded["metadata"]["main_cast"] = item.metadata.main_cast
+        encoded["metadata"]["total_seasons"] = item.metadata.total_seasons
+
+    return encoded
+
+
+# --- Fast path -------------------------------------------------------------
+#
+# encode_midia_row produces the same dict as json_encode_item(ListItemsItem(**row))
+# for well-formed rows, without building Pydantic models. The per-category field
+# map is compiled once from the MetadataItem fields (aliases and defaults), so the
+# two paths cannot drift apart. Set MIDIA_VALIDATE_ROWS=1 to route every row
+# through the Pydantic models instead (validation/debug mode).
+
+VALIDATE_ROWS = os.getenv("MIDIA_VALIDATE_ROWS", "").lower() in ("1", "true")
+
+CATEGORY_METADATA_FIELDS: Dict[str, Dict[str, str]] = {
+    "livro": {"author": "author", "pages": "pages", "editor": "editor"},
+    "filme": {"duration": "duration", "director": "director", "star": "star"},
+    "jogo": {"platform": "platform", "developers": "developers"},
+    "anime": {"episodes": "episodes", "mal_id": "mal_id"},
+    "manga": {
+        "type": "type",
+        "status": "status",
+        "volumes": "volumes",
+        "chapters": "chapters",
+        "authors": "authors",
+        "serializations": "serializations",
+        "mal_id": "mal_id_manga",
+    },
+    "serie": {
+        "mean_runtime": "mean_runtime",
+        "creators": "creators",
+        "main_cast": "main_cast",
+        "total_seasons": "total_seasons",
+    },
+}
+
+_FieldSpec = Tuple[str, str, Any, Optional[Callable[[Any], Any]]]
+
+
+def _to_int(v):
+    if v is None or isinstance(v, int):
+        return v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return int(str(v).strip())
+
+
+def _converter_for(field_name: str) -> Optional[Callable[[Any], Any]]:
+    if field_name in ("platform", "developers"):
+        return _join_stringified_list
+    if MetadataItem.model_fields[field_name].annotation == Optional[int]:
+        return _to_int
+    return None
+
+
+def _compile_metadata_fields() -> Dict[str, List[_FieldSpec]]:
+    compiled = {}
+    for category, fields in CATEGORY_METADATA_FIELDS.items():
+        specs = []
+        for out_key, field_name in fields.items():
+            field = MetadataItem.model_fields[field_name]
+            specs.append(
+                (out_key, field.alias, field.default, _converter_for(field_name))
+            )
+        compiled[category] = specs
+    return compiled
+
+
+_METADATA_SPECS = _compile_metadata_fields()
+
+
+def _encode_metadata(category: str, raw) -> dict:
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    raw = raw or {}
+
+    metadata = {}
+    for out_key, alias, default, convert in _METADATA_SPECS.get(category, ()):
+        if alias in raw:
+            value = raw[alias]
+            metadata[out_key] = convert(value) if convert else value
+        else:
+            metadata[out_key] = list(default) if isinstance(default, list) else default
+    return metadata
+
+
+def encode_midia_row(db_item: dict) -> dict:
+    """Encodes a raw `midia` row into the API item dict."""
+    if VALIDATE_ROWS:
+        return json_encode_item(ListItemsItem(**db_item))
+
+    item_id = db_item["id"]
+    category = db_item["categoria"]
+    return {
+        "id": "" if item_id is None else str(item_id),
+        "title": db_item["titulo"],
+        "category": category,
+        "genres": list(db_item.get("generos") or []),
+        "unified_genres": list(db_item.get("generos_unificados") or []),
+        "metadata": _encode_metadata(category, db_item.get("metadata")),
+        "cover_url": db_item.get("imagem", ""),
+        "release_year": _to_int(db_item.get("ano_lancamento")),
+        "description": db_item.get("descricao", ""),
+        "age_rating": _to_int(db_item.get("classificacao")),
+    }
@@ -1,11 +1,60 @@
-from typing import Any, Optional, Dict, Union
+from typing import Any, Callable, Optional, Dict, Union
+from datetime import date, datetime
+from decimal import Decimal
+from pydantic import BaseModel
+import base64
+import gzip
 import json
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+COMPRESSION_MIN_SIZE = 1024
+
 _DEFAULT_HEADERS = {
     "Content-Type": "application/json",
 }
 
 
+def _json_default(obj: Any) -> Any:
+    """Handles the types DynamoDB/Pydantic hand us that JSON can't encode."""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _orjson_dumps(payload: Any) -> str:
+    return orjson.dumps(
+        payload, default=_json_default, option=orjson.OPT_NON_STR_KEYS
+    ).decode("utf-8")
+
+
+def _stdlib_dumps(payload: Any) -> str:
+    return json.dumps(payload, default=_json_default)
+
+
+json_dumps: Callable[[Any], str] = _orjson_dumps if orjson else _stdlib_dumps
+
+
+def set_json_encoder(encoder: Callable[[Any], str]) -> None:
+    """Replaces the encoder used by api_response (e.g. for debugging)."""
+    global json_dumps
+    json_dumps = encoder
+
+
 def api_response(
     status_code: int,
     body: Optional[Dict[str, Any]] = None,
@@ -32,7 +81,75 @@ def api_response(
     return {
         "statusCode": status_code,
         "headers": final_headers,
-        "body": json.dumps(payload) if payload is not None else "",
+        "body": json_dumps(payload) if payload is not None else "",
+    }
+
+
+def _parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Parses an Accept-Encoding header into {coding: q}."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def _choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress_response(
+    response: Dict[str, Any],
+    accept_encoding: Optional[str],
+    min_size: int = COMPRESSION_MIN_SIZE,
+) -> Dict[str, Any]:
+    """
+    Compresses the body of an api_response with br or gzip, following the
+    client's Accept-Encoding. Small or already encoded bodies are returned as-is.
+    """
+    body = response.get("body")
+    if not isinstance(body, str) or response.get("isBase64Encoded"):
+        return response
+
+    raw = body.encode("utf-8")
+    if len(raw) < min_size:
+        return response
+
+    encoding = _choose_encoding(accept_encoding)
+    if encoding == "br":
+        compressed = brotli.compress(raw, quality=5)
+    elif encoding == "gzip":
+        compressed = gzip.compress(raw, compresslevel=5)
+    else:
+        return response
+
+    return {
+        **response,
+        "headers": {
+            **(response.get("headers") or {}),
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+        },
+        "body": base64.b64encode(compressed).decode("ascii"),
+        "isBase64Encoded": True,
     }
 
 
@@ -53,6 +170,11 @@ def created(
     return api_response(201, body=data, headers=headers)
 
 
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Not modified response (304)."""
+    return api_response(304, headers={**(headers or {}), "ETag": etag})
+
+
 def bad_request(error: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """Bad request response (400)."""
     return api_response(400, error=error, headers=headers)
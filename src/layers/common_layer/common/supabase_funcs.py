@@ -1,144 +1,73 @@
 from supabase import Client, create_client
-from pydantic import BaseModel, Field, field_validator
 from common.configs import CATEGORIES_AVAILABLE
-from typing import Optional
+from common.cache import TTLCache
+from common.models import encode_midia_row
+from concurrent.futures import ThreadPoolExecutor
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    before_sleep_log,
+)
 from loguru import logger
-import os, ast, json
+import os
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-
-class MetadataItem(BaseModel):
-    # Books
-    author: Optional[str] = Field(None, alias="autor")
-    pages: Optional[int] = Field(None, alias="paginas")
-    editor: Optional[str] = Field(None, alias="editora")
-
-    # Movies
-    duration: Optional[str] = Field(None, alias="duracao")
-    director: Optional[str] = Field(None, alias="diretor")
-    star: Optional[str] = Field(None, alias="star")
-
-    # Games
-    platform: Optional[str] = Field("", alias="plataformas")
-    developers: Optional[str] = Field("", alias="desenvolvedores")
-
-    # anime
-    episodes: Optional[int] = Field(0, alias="episodios")
-    mal_id: Optional[str | int] = Field("", alias="id_original")
-
-    # manga
-    type: Optional[str] = Field(None, alias="type")
-    status: Optional[str] = Field(None, alias="status")
-    volumes: Optional[int] = Field(None, alias="volumes")
-    chapters: Optional[int] = Field(None, alias="chapters")
-    authors: Optional[list[str]] = Field([], alias="authors")
-    serializations: Optional[list[str]] = Field([], alias="serializations")
-    mal_id_manga: Optional[str | int] = Field("", alias="mal_id")
-
-    # serie
-    mean_runtime: Optional[int] = Field(0, alias="duracao_media")
-    creators: Optional[str] = Field("", alias="criadores")
-    main_cast: Optional[str] = Field("", alias="elenco_principal")
-    total_seasons: Optional[int] = Field(0, alias="total_temporadas")
-
-    @field_validator("platform", "developers", mode="before")
-    @classmethod
-    def parse_stringified_list(cls, v):
-        if v is None:
-            return ""
-        if isinstance(v, list):
-            return ",".join(v)
-
-        if isinstance(v, str):
-            v = v.strip()  # Remove espaços extras
-            try:
-                parsed = ast.literal_eval(v)
-                return (
-                    ",".join(parsed) if isinstance(parsed, list) else ",".join([parsed])
-                )
-            except (ValueError, SyntaxError):
-                return ",".join([v])
-        return v
-
-
-class ListItemsItem(BaseModel):
-    id: str = Field(..., alias="id")
-    title: str = Field(..., alias="titulo")
-    category: str = Field(..., alias="categoria")
-    genres: list[str] = Field([], alias="generos")
-    unified_genres: list[str] = Field([], alias="generos_unificados")
-    metadata: MetadataItem = Field(MetadataItem(), alias="metadata")
-    cover_url: Optional[str] = Field("", alias="imagem")
-    release_year: Optional[int] = Field(None, alias="ano_lancamento")
-    description: Optional[str] = Field("", alias="descricao")
-    age_rating: Optional[int] = Field(None, alias="classificacao")
-
-    @field_validator("id", mode="before")
-    @classmethod
-    def parse_stringified_list(cls, v):
-        return "" if v is None else str(v)
-
-    @field_validator("metadata", mode="before")
-    @classmethod
-    def parse_metadata(cls, v):
-        if isinstance(v, str):
-            try:
-                v_dict = json.loads(v)
-                return v_dict
-            except json.JSONDecodeError:
-                return v
-        return v
-
-
-def json_encode_item(item: ListItemsItem) -> dict:
-    encoded = item.model_dump()
-    encoded["metadata"] = {}
-    if item.category == "livro":
-        encoded["metadata"]["author"] = item.metadata.author
-        encoded["metadata"]["pages"] = item.metadata.pages
-        encoded["metadata"]["editor"] = item.metadata.editor
-
-    elif item.category == "filme":
-        encoded["metadata"]["duration"] = item.metadata.duration
-        encoded["metadata"]["director"] = item.metadata.director
-        encoded["metadata"]["star"] = item.metadata.star
-
-    elif item.category == "jogo":
-        encoded["metadata"]["platform"] = item.metadata.platform
-        encoded["metadata"]["developers"] = item.metadata.developers
-
-    elif item.category == "anime":
-        encoded["metadata"]["episodes"] = item.metadata.episodes
-        encoded["metadata"]["mal_id"] = item.metadata.mal_id
-
-    elif item.category == "manga":
-        encoded["metadata"]["type"] = item.metadata.type
-        encoded["metadata"]["status"] = item.metadata.status
-        encoded["metadata"]["volumes"] = item.metadata.volumes
-        encoded["metadata"]["chapters"] = item.metadata.chapters
-        encoded["metadata"]["authors"] = item.metadata.authors
-        encoded["metadata"]["serializations"] = item.metadata.serializations
-        encoded["metadata"]["mal_id"] = item.metadata.mal_id_manga
-
-    elif item.category == "serie":
-        encoded["metadata"]["mean_runtime"] = item.metadata.mean_runtime
-        encoded["metadata"]["creators"] = item.metadata.creators
-        encoded["metadata"]["main_cast"] = item.metadata.main_cast
-        encoded["metadata"]["total_seasons"] = item.metadata.total_seasons
-
-    return encoded
-
-
-def get_midia_info(media_id):
-    response = supabase.table("midia").select("*").eq("id", media_id).execute()
-    db_item = response.data[0] if response.data else {}
-    return json_encode_item(ListItemsItem(**db_item)) if db_item else {}
-
-
-def get_bulk_midia_info(media_ids, batch_size=200):
+# Chunks are fetched in parallel through the shared client above, whose HTTP
+# session keeps connections alive across calls and warm invocations.
+MIDIA_FETCH_WORKERS = int(os.getenv("MIDIA_FETCH_WORKERS", 4))
+
+# The midia catalog only changes during ETL runs, so warm containers can keep
+# hydrated rows around between invocations.
+midia_cache = TTLCache(
+    ttl=float(os.getenv("MIDIA_CACHE_TTL", 3600)),
+    max_items=int(os.getenv("MIDIA_CACHE_MAX_ITEMS", 20000)),
+    max_bytes=int(os.getenv("MIDIA_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
+# Per-genre candidate lists from the fallback_candidates view. They only change
+# when the ETL refreshes the view, and every user shares them.
+fallback_cache = TTLCache(
+    ttl=float(os.getenv("FALLBACK_CACHE_TTL", 3600)),
+    max_items=int(os.getenv("FALLBACK_CACHE_MAX_ITEMS", 1000)),
+    max_bytes=int(os.getenv("FALLBACK_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+)
+# Rank fallbacks in memory from fallback_candidates instead of calling the
+# get_recommendations RPC.
+FALLBACK_FROM_POOL = os.getenv("FALLBACK_FROM_POOL", "0") == "1"
+ALL_GENRES = "*"
+GENRE_MISMATCH_PENALTY = 5.0
+
+# Column sets selected from `midia` per use case. Columns left out fall back to
+# the ListItemsItem defaults, so every view keeps the same output shape.
+MIDIA_VIEWS = {
+    "detail": "id, titulo, categoria, descricao, ano_lancamento, imagem, metadata, "
+    "generos, generos_unificados, classificacao",
+    "card": "id, titulo, categoria, ano_lancamento, imagem, metadata, "
+    "generos_unificados, classificacao",
+    "recommendation": "id, titulo, categoria, ano_lancamento, imagem, metadata, "
+    "generos_unificados",
+    "genres": "id, titulo, categoria, generos_unificados",
+}
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.2, min=0.2, max=2),
+    before_sleep=before_sleep_log(logger, "WARNING"),
+)
+def _fetch_midia_chunk(batch_ids, columns):
+    return supabase.table("midia").select(columns).in_("id", batch_ids).execute().data
+
+
+def get_midia_info(media_id, view="detail"):
+    return get_bulk_midia_info([media_id], view=view).get(str(media_id), {})
+
+
+def get_bulk_midia_info(media_ids, batch_size=200, view="detail"):
     midia_dict = {}
     if not media_ids:
         return midia_dict
@@ -147,16 +76,38 @@ def get_bulk_midia_info(media_ids, batch_size=200):
         for i in range(0, len(lst), n):
             yield lst[i : i + n]
 
-    for batch_ids in chunk_list(media_ids, batch_size):
+    columns = MIDIA_VIEWS[view]
+    unique_ids = list(dict.fromkeys(str(media_id) for media_id in media_ids))
+    cached = midia_cache.get_many((view, media_id) for media_id in unique_ids)
+    midia_dict = {media_id: item for (_, media_id), item in cached.items()}
+    missing_ids = [media_id for media_id in unique_ids if media_id not in midia_dict]
+
+    def fetch_chunk(batch_ids):
         try:
-            response = (
-                supabase.table("midia").select("*").in_("id", batch_ids).execute()
-            )
-            for db_item in response.data:
-                processed_item = json_encode_item(ListItemsItem(**db_item))
-                midia_dict[processed_item["id"]] = processed_item
+            return _fetch_midia_chunk(batch_ids, columns)
         except Exception as e:
-            logger.error(f"Erro ao processar lote: {e}")
+            logger.error(f"Erro ao processar lote ({len(batch_ids)} ids): {e}")
+            return []
+
+    chunks = list(chunk_list(missing_ids, batch_size))
+    if len(chunks) <= 1:
+        results = map(fetch_chunk, chunks)
+    else:
+        workers = min(MIDIA_FETCH_WORKERS, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fetch_chunk, chunks))
+
+    for rows in results:
+        for db_item in rows:
+            try:
+                processed_item = encode_midia_row(db_item)
+            except Exception as e:
+                logger.error(f"Erro ao processar midia {db_item.get('id')}: {e}")
+                continue
+            midia_dict[processed_item["id"]] = processed_item
+            midia_cache.set((view, processed_item["id"]), processed_item)
+
+    logger.debug(f"midia_cache stats: {midia_cache.stats()}")
     return midia_dict
 
 
@@ -178,12 +129,81 @@ def search_midia(search_term, year=None, category=None):
     score_max = 0.0
     if response.data:
         score_max = response.data[0].get("score_similaridade", 0.0)
+    return [encode_midia_row(item) for item in response.data], score_max
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.2, min=0.2, max=2),
+    before_sleep=before_sleep_log(logger, "WARNING"),
+)
+def _fetch_fallback_candidates(genre):
+    return (
+        supabase.table("fallback_candidates")
+        .select(f"{MIDIA_VIEWS['recommendation']}, rating")
+        .eq("genero", genre)
+        .order("pos")
+        .execute()
+        .data
+    )
+
+
+def get_fallback_candidates(genres):
+    """Returns {genre: candidate rows}, reading through `fallback_cache`."""
+    pools = fallback_cache.get_many(genres)
+    missing = [genre for genre in genres if genre not in pools]
+    if not missing:
+        return pools
+
+    workers = min(MIDIA_FETCH_WORKERS, len(missing))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for genre, rows in zip(
+            missing, executor.map(_fetch_fallback_candidates, missing)
+        ):
+            pools[genre] = rows
+            fallback_cache.set(genre, rows)
+    return pools
+
+
+def _fallback_score(row, top_genres):
+    """Same score as get_recommendations: weighted genre overlap plus rating."""
+    rating = float(row.get("rating") or 0)
+    if not top_genres:
+        return rating
+    genre_score = sum(
+        float(top_genres.get(genre, -GENRE_MISMATCH_PENALTY))
+        for genre in row.get("generos_unificados") or []
+    )
+    return genre_score * 10 + rating
+
+
+def _rank_fallback_pool(consumed_ids, top_genres, limit):
+    consumed = {int(media_id) for media_id in consumed_ids}
+    pools = get_fallback_candidates(list(top_genres) or [ALL_GENRES])
+
+    by_category = {c: {} for c in CATEGORIES_AVAILABLE}
+    for rows in pools.values():
+        for row in rows:
+            media_id = int(row["id"])
+            category = by_category.get(row["categoria"])
+            if category is None or media_id in consumed or media_id in category:
+                continue
+            category[media_id] = row
+
+    def sort_key(row):
+        return _fallback_score(row, top_genres), float(row.get("rating") or 0)
+
     return [
-        json_encode_item(ListItemsItem(**item)) for item in response.data
-    ], score_max
+        encode_midia_row(row)
+        for candidates in by_category.values()
+        for row in sorted(candidates.values(), key=sort_key, reverse=True)[:limit]
+    ]
 
 
 def get_fallback_recommendations(consumed_ids, top_genres, limit=5):
+    if FALLBACK_FROM_POOL:
+        return _rank_fallback_pool(consumed_ids, top_genres or {}, limit)
+
     rpc_response = supabase.rpc(
         "get_recommendations",
         {
@@ -192,7 +212,7 @@ def get_fallback_recommendations(consumed_ids, top_genres, limit=5):
             "p_limit": limit,
         },
     ).execute()
-    return [json_encode_item(ListItemsItem(**item)) for item in rpc_response.data]
+    return [encode_midia_row(item) for item in rpc_response.data]
 
 
 def get_item_recommendation(source_id, source_category, target_category=None):
@@ -211,10 +231,13 @@ def get_item_recommendation(source_id, source_category, target_category=None):
             continue
         target_ids.append(item["alvo_id"])
 
-    all_media_records = get_bulk_midia_info(target_ids)
+    all_media_records = get_bulk_midia_info(target_ids, view="recommendation")
     recommendations = {c: [] for c in CATEGORIES_AVAILABLE}
-    for midia in all_media_records.values():
-        cat = midia.get("categoria")
+    for target_id in target_ids:
+        midia = all_media_records.get(str(target_id))
+        if not midia:
+            continue
+        cat = midia.get("category")
         if cat not in recommendations:
             recommendations[cat] = []
         recommendations[cat].append(midia)
@@ -235,17 +258,15 @@ def build_media_map(
         try:
             response = (
                 supabase.table("midia")
-                .select("id, titulo, metadata")
+                .select(f"id, titulo, original_id:metadata->>{supabase_id_key}")
                 .eq("categoria", category)
                 .in_("titulo", chunk_titles)
                 .execute()
             )
-            print(response.data)
 
             for db_item in response.data:
                 db_title = db_item.get("titulo")
-                db_metadata = db_item.get("metadata") or {}
-                db_id = str(db_metadata.get(supabase_id_key) or "")
+                db_id = str(db_item.get("original_id") or "")
                 expected_id = title_to_id.get(db_title)
 
                 if expected_id and db_id == expected_id:
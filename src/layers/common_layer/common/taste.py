@@ -0,0 +1,139 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from common.dynamo_client import db_client
+from common.genres import GENRE_INDEX, GENRE_VOCABULARY
+from common.supabase_funcs import get_midia_info
+
+# Per-user genre taste: `weights` and `counts` are lists in GENRE_VOCABULARY
+# order, `rev` is the library revision they reflect and `vocab` the vocabulary
+# size they were built with. Library writes update it in the same transaction
+# that bumps meta#rev; anything else that bumps the revision (syncs) leaves it
+# behind, and readers rebuild it from the history.
+TASTE_SK = "meta#taste"
+IGNORED_STATUSES = {"planned", "abandoned"}
+
+
+def genre_weight(rating, status) -> float:
+    """How much a library item adds to each of its genres (0 if it doesn't count)."""
+    rating = float(rating or 0)
+    if rating <= 0 or str(status or "planned") in IGNORED_STATUSES:
+        return 0.0
+    if rating >= 4:
+        return rating
+    if rating == 3:
+        return 1.0
+    return rating - 10
+
+
+def build_taste_item(
+    user_id: str,
+    rev: int,
+    items_to_score: Iterable[Tuple[int, float]],
+    midia_info_map: Dict[str, dict],
+) -> dict:
+    """
+    Builds the taste item from (midia_id, weight) pairs, with genres looked
+    up in `midia_info_map` (keyed by str id, as get_bulk_midia_info returns).
+    """
+    weights = [0.0] * len(GENRE_VOCABULARY)
+    counts = [0] * len(GENRE_VOCABULARY)
+    for midia_id, weight in items_to_score:
+        midia_info = midia_info_map.get(str(midia_id)) or {}
+        for genre in dict.fromkeys(midia_info.get("unified_genres") or []):
+            index = GENRE_INDEX.get(genre)
+            if index is not None:
+                weights[index] += weight
+                counts[index] += 1
+
+    return {
+        "user_id": user_id,
+        "sk": TASTE_SK,
+        "rev": rev,
+        "vocab": len(GENRE_VOCABULARY),
+        "weights": weights,
+        "counts": counts,
+    }
+
+
+def is_current(taste: Optional[dict], rev: int) -> bool:
+    return (
+        bool(taste)
+        and int(taste.get("rev") or 0) == rev
+        and int(taste.get("vocab") or 0) == len(GENRE_VOCABULARY)
+    )
+
+
+def taste_to_genres(taste: dict) -> Dict[str, float]:
+    """Genre weights for get_fallback_recommendations, heaviest first."""
+    genres = {
+        genre: float(weight)
+        for genre, weight, count in zip(
+            GENRE_VOCABULARY, taste["weights"], taste["counts"]
+        )
+        if count
+    }
+    return dict(sorted(genres.items(), key=lambda x: x[1], reverse=True))
+
+
+def build_taste_tx(
+    user_id: str,
+    media_id,
+    taste: Optional[dict],
+    old_item: Optional[dict],
+    new_item: Optional[dict],
+) -> Optional[dict]:
+    """
+    Transaction entry moving the stored taste from `old_item` to `new_item`
+    (None for an add or a delete) and advancing its revision alongside
+    meta#rev. Returns None when there is no vector of the current vocabulary
+    to update, or when the item's genres can't be read; either way the
+    vector falls behind the revision and the next reader rebuilds it.
+    """
+    if not taste or int(taste.get("vocab") or 0) != len(GENRE_VOCABULARY):
+        return None
+
+    old_weight = genre_weight(*_rating_status(old_item))
+    new_weight = genre_weight(*_rating_status(new_item))
+    deltas: List[Tuple[int, float, int]] = []
+    if old_weight != new_weight:
+        midia_info = get_midia_info(media_id, view="genres")
+        if not midia_info:
+            return None
+        genres = midia_info.get("unified_genres") or []
+        count_delta = bool(new_weight) - bool(old_weight)
+        deltas = [
+            (GENRE_INDEX[genre], new_weight - old_weight, count_delta)
+            for genre in dict.fromkeys(genres)
+            if genre in GENRE_INDEX
+        ]
+
+    set_parts = []
+    names = {"#rev": "rev"}
+    values: Dict[str, Any] = {":one": 1}
+    for index, weight_delta, count_delta in deltas:
+        set_parts.append(f"#w[{index}] = #w[{index}] + :w{index}")
+        names["#w"] = "weights"
+        values[f":w{index}"] = weight_delta
+        if count_delta:
+            set_parts.append(f"#c[{index}] = #c[{index}] + :c{index}")
+            names["#c"] = "counts"
+            values[f":c{index}"] = count_delta
+
+    update_expression = "ADD #rev :one"
+    if set_parts:
+        update_expression = f"SET {', '.join(set_parts)} {update_expression}"
+
+    return {
+        "Update": {
+            "TableName": db_client.table_name,
+            "Key": db_client.to_dynamo_json({"user_id": str(user_id), "sk": TASTE_SK}),
+            "UpdateExpression": update_expression,
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": db_client.to_dynamo_json(values),
+        }
+    }
+
+
+def _rating_status(item: Optional[dict]) -> Tuple[Any, Any]:
+    if not item:
+        return 0, None
+    return item.get("rating"), item.get("status")
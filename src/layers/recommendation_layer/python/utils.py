@@ -1,30 +1,48 @@
-from common.dynamo_client import DynamoClient
+from common.configs import CATEGORIES_AVAILABLE
+from common.dynamo_client import db_client, REVISION_SK
 from common.supabase_funcs import get_bulk_midia_info
-from collections import defaultdict
-
-
-def get_user_history(user_id):
-    dynamo = DynamoClient()
-    user_history = []
-    next_token = None
-
-    while True:
-        response = dynamo.query_items(user_id, "item#", next_token=next_token)
-        user_history.extend(response.get("items", []))
-
-        next_token = response.get("next_token")
-        if not next_token:
-            break
-
-    return user_history
-
-
-def get_user_top_genres(user_history):
+from common.taste import (
+    TASTE_SK,
+    build_taste_item,
+    genre_weight,
+    is_current,
+    taste_to_genres,
+)
+from datetime import datetime, timezone
+
+HISTORY_PROJECTION = ["sk", "rating", "status"]
+
+
+def get_user_history(user_id, projection=HISTORY_PROJECTION):
+    return list(
+        db_client.iter_query(
+            user_id,
+            "item#",
+            projection=projection,
+            categories=CATEGORIES_AVAILABLE,
+        )
+    )
+
+
+def get_recommendation_version(user_id):
+    """
+    Version token for conditional recommendation responses: the library
+    revision plus the UTC day, since the recommendations table is rebuilt daily.
+    """
+    rev = db_client.get_revision(user_id)
+    if rev is None:
+        return None
+    return f"recs-{rev}-{datetime.now(timezone.utc).date().isoformat()}"
+
+
+def get_scored_history(user_history):
+    """
+    Parses the history once. Returns (all_consumed_ids, items_to_score), the
+    latter holding (midia_id, weight) for items that count towards genre
+    scores.
+    """
     all_consumed_ids = []
     items_to_score = []
-    ids_to_fetch_info = set()
-
-    IGNORED_STATUSES = {"planned", "abandoned"}
 
     for item in user_history:
         sk = item.get("sk")
@@ -36,48 +54,47 @@ def get_user_top_genres(user_history):
         except ValueError:
             continue
 
-        try:
-            midia_id = int(item["sk"].split("#")[-1])
-        except (ValueError, IndexError):
-            continue
-
         all_consumed_ids.append(midia_id)
 
-        rating = float(item.get("rating") or 0)
-        status = str(item.get("status") or "planned")
-
-        if rating > 0 and status not in IGNORED_STATUSES:
-            items_to_score.append((midia_id, rating))
-            ids_to_fetch_info.add(midia_id)
-
-    if not ids_to_fetch_info:
-        return all_consumed_ids, {}
-
-    midia_info_map = get_bulk_midia_info(list(ids_to_fetch_info))
-    genre_scores = defaultdict(float)
-
-    for midia_id, rating in items_to_score:
-        midia_info = midia_info_map.get(midia_id)
-        if not midia_info:
-            continue
-
-        genres = midia_info.get("unified_genres", [])
-        if not genres:
-            continue
-
-        if rating >= 4:
-            weight = rating
-        elif rating == 3:
-            weight = 1
-        else:
-            weight = rating - 10
-
-        for genre in genres:
-            genre_scores[genre] += weight
-
-    sorted_genres = dict(sorted(genre_scores.items(), key=lambda x: x[1], reverse=True))
-
-    return all_consumed_ids, sorted_genres
+        weight = genre_weight(item.get("rating"), item.get("status"))
+        if weight:
+            items_to_score.append((midia_id, weight))
+
+    return all_consumed_ids, items_to_score
+
+
+def get_user_top_genres(user_id, user_history=None, history_rev=None):
+    """
+    Genre weights of the user, heaviest first, read from their stored taste
+    vector. When the vector is missing or behind the library revision it is
+    rebuilt from the history and stored again. Pass `user_history` to reuse
+    a history already read, with `history_rev` the revision read before it;
+    without that revision the rebuilt vector is served but not stored.
+    """
+    stored = db_client.batch_get_items(user_id, [REVISION_SK, TASTE_SK])
+    rev = stored.get(REVISION_SK, {}).get("rev")
+    taste = stored.get(TASTE_SK)
+    if is_current(taste, int(rev or 0)):
+        return taste_to_genres(taste)
+
+    # The history must be read after the revision it is stored under, so a
+    # write landing in between makes put_item_at_revision refuse the vector.
+    storable = True
+    if user_history is None:
+        user_history = get_user_history(user_id)
+    else:
+        rev, storable = history_rev, history_rev is not None
+    _, items_to_score = get_scored_history(user_history)
+    midia_info_map = get_bulk_midia_info(
+        list({midia_id for midia_id, _ in items_to_score}), view="genres"
+    )
+    taste = build_taste_item(user_id, int(rev or 0), items_to_score, midia_info_map)
+    # A failed chunk leaves ids out of the map: serve the partial vector, but
+    # don't store it as current.
+    complete = all(str(midia_id) in midia_info_map for midia_id, _ in items_to_score)
+    if complete and storable:
+        db_client.put_item_at_revision(taste, rev)
+    return taste_to_genres(taste)
 
 
 def get_user_consumed_ids(user_history):